@@ -1,22 +1,68 @@
 import os
 import random
-import requests
-import openai
+import time
 import streamlit as st
-from newspaper import Article
 from datetime import datetime
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
-from google.oauth2.service_account import Credentials
-import pandas as pd
-
-# 🔐 APIキー（差し替えてください）
-OPENAI_API_KEY = st.secrets["openai_api_key"]
-NEWS_API_KEY = st.secrets["news_api_key"]
-WEATHER_API_KEY = st.secrets["weather_api_key"]
+from sheet_cache import cache_worksheets, flush_worksheets, sync_stats, write_stats
+from storage import mirror_stats, open_tables
+from workers import iter_completed, run_with_timeout, submit
+import http_client
+from response_cache import ResponseCache, make_store
+from gpt_cache import CompletionCache
+from topic_parser import TopicStreamParser, format_topics, parse_topics
+import prompts
+from topic_pool import TopicPool
+from article_worker import ArticleWorker
+from id_allocator import IdAllocator, max_numeric
+from metrics import mark_error, metrics, traced
+
+# 🔐 APIキー（secrets.toml に無ければ環境変数 OPENAI_API_KEY などを見る）
+# import 時には読まず、使うときに読む（記事解析の子プロセスやバッチが app を import しても軽いように）
+# openai / gspread / pandas などの重いライブラリも、使う関数の中で import する
+def get_secret(name, default=None):
+    try:
+        if name in st.secrets:
+            return st.secrets[name]
+    except Exception:
+        pass  # secrets.toml が無い
+    return os.environ.get(name.upper(), default)
+
+@st.cache_resource
+def get_openai_client():
+    import openai
+
+    return openai.OpenAI(api_key=get_secret("openai_api_key"))
+
+# 外部API呼び出しの段階ごとのタイムアウト（秒）
+STAGE_TIMEOUTS = {"news": 8, "article": 6, "weather": 5, "gpt": 60}
+WEATHER_ERROR = ("取得エラー", "-", "-", "")
+
+# 天気ネタ用の都市（表示名 → WeatherAPI の都市名）
+JAPAN_CITIES = {
+    "東京": "Tokyo", "大阪": "Osaka", "名古屋": "Nagoya", "札幌": "Sapporo",
+    "福岡": "Fukuoka", "仙台": "Sendai", "広島": "Hiroshima", "那覇": "Naha",
+    "京都": "Kyoto", "横浜": "Yokohama", "神戸": "Kobe", "金沢": "Kanazawa",
+    "岡山": "Okayama-Shi", "高松": "Takamatsu-Shi"
+}
 
 # === Google Sheets 初期化（secrets.toml 対応） ===
-def init_google_sheets():
+# プロセスごとに1回だけ開き、各シートはTTL付きキャッシュ越しに使う
+# secrets.toml の storage_backend で保存先を切り替える
+#   "sheets"（既定） / "sqlite"（ローカルのみ） / "sqlite+sheets"（ローカル＋Sheetsへ非同期ミラー）
+# TTL が切れたら増えた行だけを取り込み、sheet_full_sync_interval 秒ごとに全件取り直す
+SHEET_NAMES = ["topics", "groups", "persons", "talk_logs"]
+# 各シートの見出し（SQLite の空のテーブルを作るときに1行目として書く）
+SHEET_HEADERS = {
+    "topics": ["topic_id", "created_at", "title", "category", "content"],
+    "groups": ["group_id", "group_name"],
+    "persons": ["person_id", "name", "group_id"],
+    "talk_logs": ["topic_id", "person_id", "talked"],
+}
+
+def open_spreadsheet():
+    import gspread
+    from oauth2client.service_account import ServiceAccountCredentials
+
     scopes = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
     credentials = {
         "type": st.secrets["gcp_service_account"]["type"],
@@ -34,16 +80,96 @@ def init_google_sheets():
     client = gspread.authorize(creds)
 
     SPREADSHEET_ID = st.secrets["spreadsheet_id"]
+    return client.open_by_key(SPREADSHEET_ID)
+
+@st.cache_resource
+def init_google_sheets():
+    worksheets = {}
+
+    def open_worksheet(name):
+        # シート一覧は1回の取得でまとめて受け取る（シートごとに worksheet(name) を呼ばない）
+        if not worksheets:
+            worksheets.update((ws.title, ws) for ws in open_spreadsheet().worksheets())
+        return worksheets[name]
+
+    tables = open_tables(
+        st.secrets.get("storage_backend", "sheets"),
+        SHEET_NAMES,
+        open_worksheet,
+        path=st.secrets.get("sqlite_path", ".cache/launchtalk.sqlite3"),
+        headers=SHEET_HEADERS,
+    )
+    return cache_worksheets(
+        tables, full_sync_interval=float(st.secrets.get("sheet_full_sync_interval", 10 * 60))
+    )
+
+# talk_logs × topics × persons の索引（プロセスで1つ、シートの変更を差分で取り込む）
+@st.cache_resource
+def get_talk_index():
+    from talk_index import TalkIndex
+
+    sheets = init_google_sheets()
+    return TalkIndex(
+        sheets["topics"], sheets["talk_logs"], sheets["persons"],
+        dedupe_threshold=float(st.secrets.get("dedupe_threshold", 0.7)),
+    )
+
+# topic_id / person_id の払い出し（既存の最大IDは ID をまとめて借りるたびに調べ直す）
+@st.cache_resource
+def get_id_allocators():
+    path = st.secrets.get("id_allocator_path", ".cache/id_allocator.json")
+    lease_size = int(st.secrets.get("id_lease_size", 20))
+
+    def max_id(table):
+        index = get_talk_index()
+        index.refresh()
+        return max_numeric(getattr(index, table))
+
     return {
-        "topics": client.open_by_key(SPREADSHEET_ID).worksheet("topics"),
-        "groups": client.open_by_key(SPREADSHEET_ID).worksheet("groups"),
-        "persons": client.open_by_key(SPREADSHEET_ID).worksheet("persons"),
-        "talk_logs": client.open_by_key(SPREADSHEET_ID).worksheet("talk_logs"),
+        table: IdAllocator(path, table, lambda table=table: max_id(table), lease_size)
+        for table in ("topics", "persons")
     }
 
+# シートはそれを使うページだけが開く（ホームでは開かない）
+# この実行で開いたかを覚えておき、開いていなければ書き込みの送信もしない
+# （app.py は実行のたびに読み直されるので、このリストも実行ごとに空に戻る）
+_opened_sheets = []
+
+def get_sheets():
+    sheets = init_google_sheets()
+    if not _opened_sheets:
+        _opened_sheets.append(sheets)
+    return sheets
+
+# 1回の実行で溜まった書き込みをシートごとにまとめて送る
+def flush_sheet_writes():
+    if not _opened_sheets:
+        return
+    try:
+        flush_worksheets(_opened_sheets[0])
+    except Exception as e:
+        st.error(f"スプレッドシートへの書き込みに失敗しました: {e}")
+        return
+    stats = write_stats.as_dict()
+    st.sidebar.caption(
+        f"📊 Sheets書き込み: {stats['api_calls']}回 "
+        f"（節約 {stats['api_calls_saved']}回 / {stats['bytes_saved']:,} bytes）"
+    )
+    # sqlite+sheets: 裏で Sheets に送れなかった操作があれば、シートがずれていることを知らせる
+    failed = mirror_stats.as_dict()["failed"]
+    if failed:
+        st.sidebar.warning(
+            f"⚠️ Sheets へのミラーに {failed}件 失敗しています（SQLite 側は保存済み）。"
+            f"直近: {mirror_stats.last_error}"
+        )
+
+@traced("sheets.get_dataframe")
 def get_dataframe(worksheet):
+    import pandas as pd
+
     return pd.DataFrame(worksheet.get_all_records())
 
+@traced("sheets.update_dataframe")
 def update_dataframe(worksheet,df):
     worksheet.update([df.columns.values.tolist()] + df.values.tolist())
 
@@ -69,12 +195,33 @@ def load_topics_from_sheet(sheet):
         topics[title] = content
     return topics
 
+# === 外部APIレスポンスのキャッシュ（天気は都市ごと、ニュースは国ごと） ===
+# secrets.toml の response_cache_backend = "disk" でローカルファイルに保存する
+@st.cache_resource
+def get_response_caches():
+    store = make_store(st.secrets.get("response_cache_backend", "memory"))
+    return {
+        "weather": ResponseCache(store, ttl=30 * 60, stale_ttl=3 * 60 * 60),
+        "news": ResponseCache(store, ttl=15 * 60, stale_ttl=2 * 60 * 60),
+    }
+
 # 天気予報詳細（AM/PM降水確率＋アイコン）
+@traced("weather")
 def get_weather_forecast(city="Tokyo"):
+    return get_response_caches()["weather"].get_or_fetch(
+        f"weather:{city}",
+        lambda: fetch_weather_forecast(city),
+        is_valid=lambda result: result != WEATHER_ERROR,
+    )
+
+@traced("weather.fetch")
+def fetch_weather_forecast(city):
     try:
-        url = f"http://api.weatherapi.com/v1/forecast.json?key={WEATHER_API_KEY}&q={city}&lang=ja&days=1"
-        res = requests.get(url)
-        data = res.json()
+        data = http_client.get_json(
+            "http://api.weatherapi.com/v1/forecast.json",
+            params={"key": get_secret("weather_api_key"), "q": city, "lang": "ja", "days": 1},
+            endpoint="weatherapi/forecast",
+        )
 
         condition = data["current"]["condition"]["text"]
         hours = data["forecast"]["forecastday"][0]["hour"]
@@ -85,204 +232,429 @@ def get_weather_forecast(city="Tokyo"):
 
         return condition, am_rain, pm_rain, icon_url
     except Exception as e:
-        return "取得エラー", "-", "-", ""
+        mark_error(e)
+        return WEATHER_ERROR
 
 # ニュース取得
-def get_news_full():
+@traced("news")
+def get_news_full(country="us"):
+    news = get_response_caches()["news"].get_or_fetch(f"news:{country}", lambda: fetch_news_full(country))
+    # 見出しが取れたら本文を裏で先読みしておく（取得済み・取得中のURLは飛ばす）
+    get_article_worker().prefetch([article.get("url") for article in news])
+    return news
+
+@traced("news.fetch")
+def fetch_news_full(country):
     try:
-        url = f"https://newsapi.org/v2/top-headlines?country=us&apiKey={NEWS_API_KEY}"
-        res = requests.get(url)
-        data = res.json()
+        data = http_client.get_json(
+            "https://newsapi.org/v2/top-headlines",
+            params={"country": country, "apiKey": get_secret("news_api_key")},
+            endpoint="newsapi/top-headlines",
+        )
         return data.get("articles", [])[:5]
     except Exception as e:
+        mark_error(e)
         return []
 
+# GPTのタスクごとの設定（モデル・max_tokens・入力のトークン予算）
+# secrets.toml の [gpt_tasks.translate] model = "gpt-4o" のように上書きできる
+def gpt_task(task):
+    return prompts.task_settings(task, get_secret("gpt_tasks", {}).get(task))
+
 # GPT翻訳（ニュース日本語化）
 def translate_news_to_japanese(client, title, description):
-    prompt = (
-        f"以下の英語ニュースのタイトルと概要を自然な日本語に翻訳してください：\n\n"
-        f"Title: {title}\nDescription: {description}"
-    )
+    prompt = prompts.translate_prompt(title, description, gpt_task("translate"))
     return generate_topic(client, prompt)
 
-# GPT出力
+# ニュースの見出しをまとめて1回で翻訳する（訳せなかった見出しは None）
+def translate_headlines(client, articles):
+    prompt = prompts.translate_headlines_prompt(articles, gpt_task("translate"))
+    text = generate_topic(client, prompt)
+    return prompts.parse_headlines(text, len(articles)) or [None] * len(articles)
+
+# GPT応答キャッシュ（secrets.toml の gpt_cache_backend / gpt_cache_max_entries で変更可）
+@st.cache_resource
+def get_completion_cache():
+    store = make_store(
+        st.secrets.get("gpt_cache_backend", "disk"),
+        path=".cache/completions.sqlite3",
+        max_entries=int(st.secrets.get("gpt_cache_max_entries", 2000)),
+    )
+    return CompletionCache(store)
+
+# GPT出力（prompt は prompts.Prompt）。同じ入力にはキャッシュした応答を返す
+@traced("gpt.generate")
 def generate_topic(client, prompt):
+    cache = get_completion_cache()
+    key = cache.key_for(prompt.model, prompt.messages, **prompt.params())
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "user", "content": prompt}]
-        )
-        return response.choices[0].message.content.strip()
+        content, tokens = request_completion(client, prompt)
+        cache.set(key, content, tokens=tokens)
+        return content
     except Exception as e:
+        mark_error(e)
         return f"ChatGPT生成エラー: {e}"
 
-# ニュース本文取得
-def get_article_text(url):
+# GPTを1回呼ぶ（キャッシュなし）。(本文, 使ったトークン数) を返す
+def request_completion(client, prompt):
+    response = client.chat.completions.create(
+        model=prompt.model,
+        messages=prompt.messages,
+        timeout=STAGE_TIMEOUTS["gpt"],
+        **prompt.params(),
+    )
+    usage = getattr(response, "usage", None)
+    record_usage(prompt.model, usage)
+    return response.choices[0].message.content.strip(), usage.total_tokens if usage else 0
+
+def record_usage(model, usage):
+    if usage:
+        metrics.record_tokens(
+            model, getattr(usage, "prompt_tokens", 0) or 0, getattr(usage, "completion_tokens", 0) or 0
+        )
+
+# ニュース本文の先読みワーカー（解析は別プロセス、本文はURLごとにキャッシュ）
+@st.cache_resource
+def get_article_worker():
+    return ArticleWorker(max_entries=int(st.secrets.get("article_cache_max_entries", 256)))
+
+# ニュース本文取得（取れない・時間切れのときは "" を返し、計測ではエラーとして残す）
+@traced("article")
+def get_article_text(url, timeout=None):
     try:
-        article = Article(url, language='en')
-        article.download()
-        article.parse()
-        return article.text.strip()
+        return get_article_worker().get_text(url, timeout=timeout)
     except Exception as e:
-        return f"（本文取得失敗: {e}）"
+        mark_error(e)
+        return ""
 
 # === 雑談ネタ生成 ===
-def generate_weather_only_topic(client, city="Tokyo"):
-    weather = get_weather_forecast(city)
-    prompt = (
-        f"今日の天気は「{weather}」です。\n"
-        f"この天気をテーマに、日常会話で使える雑談ネタを3つ提案してください。\n"
-        f"それぞれ以下の形式で出力してください：\n"
-        f"---\nタイトル: ○○\nカテゴリ: ○○\n内容: ○○\n---"
+# 生成フォームは毎回新しいネタが欲しいので、キャッシュを使わずに生成する
+# 出力は JSON スキーマで受け取る（topic_parser が --- 区切りの出力も読める）
+NO_NEWS_MESSAGE = "ニュース情報が取得できませんでした。"
+
+def build_weather_prompt(city="Tokyo"):
+    weather = run_with_timeout(get_weather_forecast, city, timeout=STAGE_TIMEOUTS["weather"], default=WEATHER_ERROR)
+    condition, am_rain, pm_rain, _ = weather
+    return prompts.topic_prompt(
+        f"今日の{city}の天気は「{condition}」、降水確率は午前{am_rain}%・午後{pm_rain}%です。この天気をテーマにしてください。",
+        settings=gpt_task("topics"),
     )
-    return generate_topic(client, prompt)
 
-def generate_news_only_topic(client):
-    news = get_news_full()
+# ニュースが取れなかったときは None
+def build_news_prompt():
+    news = run_with_timeout(get_news_full, timeout=STAGE_TIMEOUTS["news"], default=[])
     if not news:
-        return "ニュース情報が取得できませんでした。"
+        return None
     article = news[0]
     title, description, url = article.get("title", ""), article.get("description", ""), article.get("url", "")
-    body = get_article_text(url) or description
-    prompt = (
-        f"以下のニュースをもとに雑談ネタを3つ作成してください。\n"
-        f"■タイトル: {title}\n■本文: {body[:500]}\n"
-        f"それぞれ以下の形式で出力してください：\n"
-        f"---\nタイトル: ○○\nカテゴリ: ○○\n内容: ○○\n---"
+    # 本文は先読み済みならキャッシュから。取れない・遅いときは概要で代用する
+    body = get_article_text(url, timeout=STAGE_TIMEOUTS["article"]) or description
+    # 本文は入力のトークン予算に収まるように文の区切りで切り詰める
+    return prompts.topic_prompt(
+        "以下のニュースをもとにしてください。",
+        context=f"■タイトル: {title}\n■本文: {body}",
+        settings=gpt_task("topics"),
     )
-    return generate_topic(client, prompt)
 
-def generate_keyword_topic(client, keyword):
-    prompt = (
-        f"キーワード「{keyword}」に関連する雑談ネタを3つ提案してください。\n"
-        f"それぞれ以下の形式で出力してください：\n"
-        f"---\nタイトル: ○○\nカテゴリ: ○○\n内容: ○○\n---"
+def build_keyword_prompt(keyword):
+    return prompts.topic_prompt(f"キーワード「{keyword}」に関連する話題にしてください。", settings=gpt_task("topics"))
+
+# === 雑談ネタの事前生成プール ===
+# (天気, 都市) ×14 と (ニュース, 最新の見出し) のネタを裏で作り置きする
+# secrets.toml の topic_pool_size（1キーあたりの作り置き数）と
+# topic_pool_tokens_per_hour（1時間のトークン上限、0 で無効）で調整する
+def pool_fingerprint(key):
+    mode, city = key
+    if mode == "weather":
+        return get_weather_forecast(city)[:3]
+    news = get_news_full()
+    return news[0].get("url") if news else None
+
+@st.cache_resource
+def get_topic_pool():
+    def pregenerate(key):
+        mode, city = key
+        prompt = build_weather_prompt(city) if mode == "weather" else build_news_prompt()
+        if prompt is None:
+            return None, 0
+        return request_completion(get_openai_client(), prompt)
+
+    keys = [("weather", city) for city in JAPAN_CITIES.values()] + [("news", None)]
+    pool = TopicPool(
+        keys,
+        pregenerate,
+        pool_fingerprint,
+        target_size=int(st.secrets.get("topic_pool_size", 1)),
+        tokens_per_hour=int(st.secrets.get("topic_pool_tokens_per_hour", 20000)),
     )
-    return generate_topic(client, prompt)
-
-
+    # デバッグ表示の統計はプールを作ったときに登録する（統計を見るためにプールを作らない）
+    metrics.register_source("topic_pool", pool.stats)
+    return pool.start()
+
+# GPT出力（ストリーミング）：届いた断片をそのまま返す（応答はキャッシュに入れない）
+GPT_ERROR = "ChatGPT生成エラー"
+
+def stream_topic(client, prompt):
+    model = prompt.model
+    get_completion_cache().record_bypass()
+    received = False
+    with metrics.span("gpt.stream", model=model) as span:
+        try:
+            stream = client.chat.completions.create(
+                model=model,
+                messages=prompt.messages,
+                stream=True,
+                stream_options={"include_usage": True},
+                timeout=STAGE_TIMEOUTS["gpt"],
+                **prompt.params(),
+            )
+            for chunk in stream:
+                if getattr(chunk, "usage", None):
+                    record_usage(model, chunk.usage)
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content or ""
+                if delta:
+                    if not received:
+                        span.attrs["first_token_seconds"] = round(time.monotonic() - span.started, 3)
+                        received = True
+                    yield delta
+        except Exception as e:
+            span.fail(e)
+            yield f"\n{GPT_ERROR}: {e}"
+
+# ホーム画面用：ニュース取得→翻訳（スレッド内で続けて実行）
+# 見出しは全部まとめて1回で訳してキャッシュするので、「他のネタを探す」で別の記事を選んでも追加の翻訳はいらない
+# まとめて訳した結果が読めなかったときだけ、選んだ記事を1件ずつ訳す
+# 「他のネタを探す」でも訳し直しはしない（選び直すだけで、翻訳はキャッシュから出す）
+def fetch_translated_news(client):
+    news_list = get_news_full()
+    if not news_list:
+        return None
+    index = random.randrange(len(news_list))
+    translated = translate_headlines(client, news_list)[index]
+    if translated:
+        return f"{translated['title']}\n\n{translated['description']}".strip()
+    article = news_list[index]
+    title = article.get("title", "")
+    description = article.get("description", "")
+    return translate_news_to_japanese(client, title, description)
 
 # ホーム画面（翻訳ニュース＋天気詳細）
+# ニュースと天気は同時に取りに行き、先に届いたほうから表示する
 def show_home_page(client):
     st.title("🚀 LaunchTalk")
     st.button("🟥 他のネタを探す", use_container_width=True)
 
-    news_list = get_news_full()
-    if news_list:
-        article = random.choice(news_list)
-        title = article.get("title", "")
-        description = article.get("description", "")
-        ja_news = translate_news_to_japanese(client, title, description)
-        st.markdown("### 📰 今日のランダムニュース（日本語）")
-        st.info(ja_news)
-    else:
-        st.warning("ニュース情報を取得できませんでした。")
-
     cities = ["Tokyo", "Osaka", "Nagoya", "Sapporo", "Fukuoka"]
     city = random.choice(cities)
-    condition, am_rain, pm_rain, icon_url = get_weather_forecast(city)
-    st.markdown(f"### 🌤 今日の天気：{city}")
-    if icon_url:
-        st.image(icon_url, width=64)
-    st.success(f"現在の天気は「{condition}」です")
-    st.info(f"☔ 降水確率：午前 {am_rain}% ／ 午後 {pm_rain}%")
+
+    news_slot = st.empty()
+    weather_slot = st.empty()
+    news_slot.info("📰 ニュースを取得中...")
+    weather_slot.info("🌤 天気を取得中...")
+
+    tasks = {
+        "news": (fetch_translated_news, (client,), STAGE_TIMEOUTS["news"] + STAGE_TIMEOUTS["gpt"]),
+        "weather": (get_weather_forecast, (city,), STAGE_TIMEOUTS["weather"]),
+    }
+    for name, result, error in iter_completed(tasks):
+        if name == "news":
+            with news_slot.container():
+                if result:
+                    st.markdown("### 📰 今日のランダムニュース（日本語）")
+                    st.info(result)
+                else:
+                    st.warning("ニュース情報を取得できませんでした。")
+        else:
+            condition, am_rain, pm_rain, icon_url = result or WEATHER_ERROR
+            with weather_slot.container():
+                st.markdown(f"### 🌤 今日の天気：{city}")
+                if icon_url:
+                    st.image(icon_url, width=64)
+                st.success(f"現在の天気は「{condition}」です")
+                st.info(f"☔ 降水確率：午前 {am_rain}% ／ 午後 {pm_rain}%")
 
 def summarize_description_with_gpt(client, description):
     if not description:
         return "（要約する内容がありません）"
-    prompt = (
-        f"以下のニュースの概要を日本語で、500文字以内に自然に要約してください：\n\n{description}\n\n"
-        "※難しい表現は避け、日常会話で使えるようにしてください。"
-    )
-    return generate_topic(client, prompt)
+    return generate_topic(client, prompts.summarize_prompt(description, gpt_task("summarize")))
+
+# === ページ送り（表示する分だけ描画する） ===
+PAGE_SIZES = [10, 20, 50, 100]
+
+def paginate(items, key):
+    default_size = int(st.secrets.get("page_size", 20))
+    sizes = sorted(set(PAGE_SIZES + [default_size]))
+    col1, col2, col3 = st.columns([2, 2, 3])
+    with col1:
+        page_size = st.selectbox("表示件数", sizes, index=sizes.index(default_size), key=f"{key}_page_size")
+    pages = max((len(items) + page_size - 1) // page_size, 1)
+    # 絞り込みで件数が減ったときは最後のページに寄せる
+    if st.session_state.get(f"{key}_page", 1) > pages:
+        st.session_state[f"{key}_page"] = pages
+    with col2:
+        page = st.number_input("ページ", min_value=1, max_value=pages, value=1, step=1, key=f"{key}_page")
+    start = (page - 1) * page_size
+    end = min(start + page_size, len(items))
+    with col3:
+        st.caption(f"{len(items)}件中 {start + 1 if items else 0}〜{end}件目（{page}/{pages}ページ）")
+    return items[start:end]
 
 # TOPIC一覧画面
-def show_topic_list_page(topics_sheet, talk_logs_sheet, persons_sheet):
+def show_topic_list_page(sheets):
     st.header("📝 TOPIC 一覧")
-    topics = topics_sheet.get_all_records()
-    talk_logs = talk_logs_sheet.get_all_records()
-    persons = persons_sheet.get_all_records()
-
-    topic_to_persons = {}
-    for log in talk_logs:
-        tid = str(log["topic_id"])
-        pid = log["person_id"]
-        if tid not in topic_to_persons:
-            topic_to_persons[tid] = []
-        topic_to_persons[tid].append(pid)
-
-    person_map = {str(p["person_id"]): p["name"] for p in persons}
-
-    for t in topics:
-        tid = str(t["topic_id"])
+    index = get_talk_index().refresh()
+
+    # 絞り込み（カテゴリ・話す人・日付・話した/未話）
+    with st.expander("🔍 絞り込み"):
+        col1, col2 = st.columns(2)
+        with col1:
+            category = st.selectbox("カテゴリ", ["すべて"] + index.categories(), key="topic_filter_category")
+            talked = st.radio("状態", ["すべて", "未話", "話した"], horizontal=True, key="topic_filter_talked")
+        with col2:
+            person_options = {"すべて": None}
+            person_options.update({f"{p['name']}（{pid}）": pid for pid, p in list(index.persons.items())})
+            person_label = st.selectbox("話す人", list(person_options), key="topic_filter_person")
+            dates = st.date_input("日付", value=(), key="topic_filter_dates")
+
+    date_from = dates[0].isoformat() if len(dates) > 0 else None
+    date_to = dates[-1].isoformat() if len(dates) > 0 else None
+    topic_ids = index.filter_topics(
+        category=None if category == "すべて" else category,
+        person_id=person_options[person_label],
+        talked={"すべて": None, "未話": False, "話した": True}[talked],
+        date_from=date_from,
+        date_to=date_to,
+    )
+
+    for tid in paginate(topic_ids, "topics"):
+        t = index.topic(tid)
         st.markdown(f"### 💡 {t['title']}")
         st.write(t["content"])
-        if tid in topic_to_persons:
-            st.markdown("**👥 話す人：** " + ", ".join(["✅ " + person_map.get(str(pid), "不明")+ "さん" for pid in topic_to_persons[tid]]))
+        person_ids = index.persons_for_topic(tid)
+        if person_ids:
+            st.markdown("**👥 話す人：** " + ", ".join(["✅ " + (index.person(pid) or {}).get("name", "不明") + "さん" for pid in person_ids]))
         st.markdown("---")
 
 # === topicsシートに保存 ===
 def save_generated_topics(sheet, topics_text):
+    return save_topic_entries(sheet, parse_topics(topics_text))
+
+def save_topic_entries(sheet, topics):
     now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    entries = [e.strip() for e in topics_text.strip().split("---") if e.strip()]
-    existing_ids = sheet.col_values(1)[1:]
-    ids = [int(x) for x in existing_ids if x.isdigit()]
-    current_id = max(ids) if ids else 0
+    allocator = get_id_allocators()["topics"]
     new_ids = []
 
-    for entry in entries:
-        lines = [l.strip() for l in entry.strip().split("\n") if ":" in l]
-        try:
-            title = next(l.split(":",1)[1].strip() for l in lines if l.startswith("タイトル"))
-            category = next(l.split(":",1)[1].strip() for l in lines if l.startswith("カテゴリ"))
-            content = next(l.split(":",1)[1].strip() for l in lines if l.startswith("内容"))
-            current_id += 1
-            sheet.append_row([str(current_id), now, title, category, content])
-            new_ids.append(current_id)
-        except Exception as e:
-            print(f"保存失敗: {e}\n内容: {entry}")
-            continue
+    for topic in topics:
+        new_id = allocator.allocate()
+        sheet.append_row([str(new_id), now, topic["title"], topic["category"], topic["content"]])
+        new_ids.append(new_id)
     return new_ids
 
+# === 話す人にネタを保存（その人にすでにある似たネタは保存しない） ===
+def save_topics_for_person(sheets, topics, person_id):
+    topics, duplicates = get_talk_index().refresh().drop_duplicates(topics, person_id)
+    topic_ids = save_topic_entries(sheets["topics"], topics)
+    log_talk(sheets["talk_logs"], topic_ids, person_id)
+    return topic_ids, duplicates
+
 # === talk_logsに記録 ===
 def log_talk(sheet, topic_ids, person_id):
     now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     for topic_id in topic_ids:
         sheet.append_row([str(topic_id), str(person_id)])
 
+# === 保存済みのネタからのおすすめ（GPT を呼ばずに出せるネタ） ===
+@st.cache_resource
+def get_recommender():
+    from recommend import TopicRecommender
+
+    return TopicRecommender(get_talk_index())
+
+def use_recommended_topic(sheets, topic, person_id):
+    log_talk(sheets["talk_logs"], [topic["topic_id"]], person_id)
+    st.session_state["recommended_topic_used"] = topic["title"]
+
+@traced("recommend")
+def show_recommendations(sheets, person_id, key, k=3):
+    used = st.session_state.pop("recommended_topic_used", None)
+    if used:
+        st.success(f"「{used}」を追加しました")
+    topics = get_recommender().recommend(person_id, k)
+    if not topics:
+        return
+    with st.expander("📦 保存済みのネタからのおすすめ（GPTを使わずに追加できます）"):
+        for topic in topics:
+            col1, col2 = st.columns([6, 1])
+            with col1:
+                st.markdown(f"**{topic['title']}**（{topic['category']}）")
+                st.caption(topic["content"])
+            with col2:
+                # コールバックで追加しておき、この実行の一覧にもすぐ出るようにする
+                st.button("追加", key=f"{key}_{topic['topic_id']}", on_click=use_recommended_topic, args=(sheets, topic, person_id))
+
+# === 画面の一部だけの再実行（st.fragment） ===
+# 検索・登録・チェック・削除ではフラグメントだけを再実行し、ページ全体（レイアウト・索引の更新など）は動かさない。
+# フラグメントだけの再実行では実行の最後の flush_sheet_writes が走らないので、保存したらその場で裏に送る
+def flush_sheet_writes_in_background(sheets):
+    st.session_state["background_flush"] = submit(flush_worksheets, sheets)
+
+def show_background_flush_error():
+    future = st.session_state.get("background_flush")
+    if future is None or not future.done():
+        return
+    del st.session_state["background_flush"]
+    if future.exception() is not None:
+        st.error(f"スプレッドシートへの書き込みに失敗しました: {future.exception()}")
+
 # === person_listページ ===
 def show_persons_list_page(sheets):
-    persons_df = get_dataframe(sheets["persons"])
     groups_df = get_dataframe(sheets["groups"])
+    get_talk_index().refresh()
 
     st.title("🧑‍🤝‍🧑 話す人一覧")
+    show_persons_list(
+        sheets,
+        dict(zip(groups_df["group_name"], groups_df["group_id"])),
+        dict(zip(groups_df["group_id"], groups_df["group_name"])),
+    )
+
+@st.fragment
+def show_persons_list(sheets, groups_name_to_id, group_id_to_name):
+    # 索引の更新はページを開いたときと登録したときだけ（検索の入力では読み直さない）
+    index = get_talk_index()
+    show_background_flush_error()
 
     search = st.text_input("名前で検索")
-    filtered_df = persons_df[persons_df['name'].str.contains(search, case=False, na=False)]
+    person_ids = index.search_persons(search)
 
-    
-    groups_name_to_id = dict(zip(groups_df["group_name"], groups_df["group_id"]))
-    group_id_to_name = dict(zip(groups_df["group_id"], groups_df["group_name"]))
     with st.form("register_form"):
         name = st.text_input("name")
-        group_name = st.selectbox("group", groups_df["group_name"])
+        group_name = st.selectbox("group", list(groups_name_to_id))
         submitted = st.form_submit_button("Submit")
 
     if submitted and name:
-        new_id = persons_df["person_id"].max() + 1 if not persons_df.empty else 1
+        persons_ws = sheets["persons"]
+        new_id = get_id_allocators()["persons"].allocate()
         group_id = groups_name_to_id[group_name]
-        new_row = pd.DataFrame([{
+        new_row = {
             "person_id" : new_id,
             "name" : name,
             "group_id" : group_id
-        }])
-        persons_df = pd.concat([persons_df, new_row], ignore_index=True)
-        persons_ws = sheets["persons"]
-        update_dataframe(persons_ws, persons_df)
+        }
+        # 全件を書き直さず、シートの列の並びに合わせて1行だけ追加する
+        persons_ws.append_row([new_row.get(col, "") for col in persons_ws.header()])
+        flush_sheet_writes_in_background(sheets)
+        index.refresh()
         st.success(f"{name} さんを登録しました")
-        st.rerun()
+        person_ids = index.search_persons(search)
 
-    for _, row in persons_df.iterrows():
+    for pid in paginate(person_ids, "persons"):
+        row = index.person(pid)
         col1, col2 = st.columns([3, 1])
         with col1:
             st.write(f"{row['name']}（{group_id_to_name.get(row['group_id'], '不明')}）")
@@ -293,55 +665,59 @@ def show_persons_list_page(sheets):
                 st.rerun()
 
 def show_persons_detail_page(sheets):
-    persons_df = get_dataframe(sheets["persons"])
-    topics_df = get_dataframe(sheets["topics"])
-    talk_log_df = get_dataframe(sheets["talk_logs"])
-
     person_id = st.session_state.get("selected_person_id")
     if person_id is None:
         st.warning("話す相手が選ばれていません。")
         return
 
-    person_name = persons_df[persons_df["person_id"] == person_id]["name"].values[0]
-    st.title(f"🗣 {person_name} さんのトピック管理")
-
-    person_logs = talk_log_df[talk_log_df["person_id"] == person_id]
-    merged_df = pd.merge(person_logs, topics_df, on="topic_id")
-    merged_df = merged_df.drop_duplicates(subset=["topic_id", "person_id"])
-    merged_df["talked_flag"] = merged_df["talked"].isin(["TRUE", True])
-    merged_df = merged_df.sort_values("talked_flag")
+    index = get_talk_index().refresh()
+    person = index.person(person_id)
+    if person is None:
+        st.warning("該当の人が見つかりません。")
+        return
 
+    person_name = person["name"]
+    st.title(f"🗣 {person_name} さんのトピック管理")
 
-    for _, row in merged_df.iterrows():
-        is_talked = row["talked_flag"]
+    # 一覧はページ全体の実行（開いた・編集から戻った）のときだけ索引から作り、セッションに持つ
+    st.session_state["person_topics"] = index.topics_for_person(person_id)
+    show_person_topics(sheets, person_id)
+    show_recommendations(sheets, person_id, "detail_recommend")
+
+def pending_topic_changes(person_id):
+    # 「保存する」まで溜めておく変更（話した/未話の切り替え・削除）。編集ページに行って戻っても残す
+    changes = st.session_state.setdefault("person_topic_changes", {})
+    return changes.setdefault(str(person_id), {"talked": {}, "removed": set()})
+
+@st.fragment
+def show_person_topics(sheets, person_id):
+    # チェック・削除はセッションの変更に溜めるだけ（索引もシートも触らない）
+    show_background_flush_error()
+    pending = pending_topic_changes(person_id)
+    for row in st.session_state["person_topics"]:
+        topic_id = row["topic_id"]
+        if topic_id in pending["removed"]:
+            continue
+        is_talked = pending["talked"].get(topic_id, row["talked_flag"])
         bg_color = "#eeeeee" if is_talked else "#ffffff"
 
         col1, col2, col3 = st.columns([6, 1, 1])  # 横並び：チェック＋タイトル、編集、削除
 
         with col1:
-            new_state = st.checkbox(f"{row['title']}", value=is_talked, key=f"chk_{row['topic_id']}_{person_id}", help="チェックすると話したことになります 💬")
-            if new_state != is_talked:
-                talk_log_df.loc[
-                    (talk_log_df["topic_id"] == row["topic_id"]) &
-                    (talk_log_df["person_id"] == person_id),
-                    "talked"
-                ] = "TRUE" if new_state else "FALSE"
+            new_state = st.checkbox(f"{row['title']}", value=is_talked, key=f"chk_{topic_id}_{person_id}", help="チェックすると話したことになります 💬")
+            if new_state == row["talked_flag"]:
+                pending["talked"].pop(topic_id, None)
+            else:
+                pending["talked"][topic_id] = new_state
 
         with col2:
-            if st.button("✏️", key=f"edit_{row['topic_id']}_{person_id}"):
-                st.session_state["edit_topic_id"] = row["topic_id"]
+            if st.button("✏️", key=f"edit_{topic_id}_{person_id}"):
+                st.session_state["edit_topic_id"] = topic_id
                 st.session_state["page"] = "edit_topic"
                 st.rerun()
-            
+
         with col3:
-            if st.button("🗑️", key=f"delete_{row['topic_id']}_{person_id}"):
-                talk_log_df = talk_log_df[
-                    ~( (talk_log_df["topic_id"] == row["topic_id"]) & 
-                       (talk_log_df["person_id"] == person_id) )
-                ]
-                update_dataframe(sheets["talk_logs"], talk_log_df)
-                st.success("削除しました")
-                st.rerun()
+            st.button("🗑️", key=f"delete_{topic_id}_{person_id}", on_click=remove_pending_topic, args=(pending, topic_id))
 
 
         st.markdown(
@@ -349,31 +725,44 @@ def show_persons_detail_page(sheets):
             unsafe_allow_html=True
         )
 
-        if new_state != is_talked:
-            talk_log_df.loc[
-                (talk_log_df["topic_id"] == row["topic_id"]) &
-                (talk_log_df["person_id"] == person_id),
-                "talked"
-            ] = "TRUE" if new_state else "FALSE"
-
-    if st.button("保存する"):
-        update_dataframe(sheets["talk_logs"], talk_log_df)
+    count = len(pending["talked"]) + len(pending["removed"])
+    if count:
+        st.caption(f"未保存の変更が {count}件 あります")
+    st.button("保存する", on_click=save_person_topic_changes, args=(sheets, person_id, pending))
+    if st.session_state.pop("person_topics_saved", False):
         st.success("保存しました！")
 
+# ボタンの処理はコールバックで行い、フラグメントを描く前に変更を反映しておく
+def remove_pending_topic(pending, topic_id):
+    pending["removed"].add(topic_id)
+    pending["talked"].pop(topic_id, None)
+
+def save_person_topic_changes(sheets, person_id, pending):
+    # 溜めた変更を索引（シートキャッシュ）に反映し、シートへは裏で送る
+    index = get_talk_index()
+    for topic_id, talked in pending["talked"].items():
+        index.set_talked(topic_id, person_id, talked)
+    if pending["removed"]:
+        index.remove_talks(pending["removed"], person_id)
+    pending["talked"].clear()
+    pending["removed"].clear()
+    flush_sheet_writes_in_background(sheets)
+    st.session_state["person_topics"] = index.refresh().topics_for_person(person_id)
+    st.session_state["person_topics_saved"] = True
+
 def show_edit_topic_page(sheets):
     topic_id = st.session_state.get("edit_topic_id")
     if not topic_id:
         st.warning("編集対象のトピックが選ばれていません。")
         return
 
-    topics_df = get_dataframe(sheets["topics"])
-    topic_row = topics_df[topics_df["topic_id"] == topic_id]
+    index = get_talk_index().refresh()
+    topic = index.topic(topic_id)
 
-    if topic_row.empty:
+    if topic is None:
         st.warning("該当のトピックが見つかりません。")
         return
 
-    topic = topic_row.iloc[0]
     st.title("✏️ トピック編集")
 
     new_title = st.text_input("タイトル", value=topic["title"])
@@ -381,10 +770,7 @@ def show_edit_topic_page(sheets):
     new_content = st.text_area("内容", value=topic["content"])
 
     if st.button("保存"):
-        topics_df.loc[topics_df["topic_id"] == topic_id, "title"] = new_title
-        topics_df.loc[topics_df["topic_id"] == topic_id, "category"] = new_category
-        topics_df.loc[topics_df["topic_id"] == topic_id, "content"] = new_content
-        update_dataframe(sheets["topics"], topics_df)
+        index.update_topic(topic_id, title=new_title, category=new_category, content=new_content)
         st.success("トピックを更新しました")
         st.session_state.page = "person_detail"
         st.rerun()
@@ -398,17 +784,18 @@ def show_edit_topic_page(sheets):
 
 LOGO_URL = "https://raw.githubusercontent.com/tachi57613/sourcetree_test/main/appventure_logo.png"
 
-# サイドバー上部にロゴを表示（常時見える）
-st.sidebar.markdown(
+# ロゴとデザインは実行のたびに描く（import しただけでは描かない）
+def show_layout():
+    # サイドバー上部にロゴを表示（常時見える）
+    st.sidebar.markdown(
     f"""
     <div class="sidebar-bottom-logo">
         <img src="{LOGO_URL}" width="80" height="80" alt="Logo" style="border-radius: 50%; margin-bottom: 10px;">
     </div>
     """, unsafe_allow_html=True)
 
-
-# 💡 デザイン適用
-st.markdown("""<style>
+    # 💡 デザイン適用
+    st.markdown("""<style>
         /* === サイドバー背景をロゴ色に合わせる === */
     [data-testid="stSidebar"] {
         background-color: 	#fdf7f2;
@@ -444,45 +831,78 @@ st.markdown("""<style>
     </style>
     """, unsafe_allow_html=True)
 
-# ✅ Sheetsなど初期化
-sheets = init_google_sheets()
+# === 計測（secrets.toml の debug_panel = true か URL に ?debug=1 でサイドバーに表示） ===
+def start_metrics_run():
+    metrics.log_path = st.secrets.get("metrics_log_path")  # 例: ".cache/metrics.jsonl"
+    metrics.register_source("http", http_client.endpoint_stats.as_dict)
+    metrics.register_source("sheets_writes", write_stats.as_dict)
+    metrics.register_source("sheets_sync", sync_stats.as_dict)
+    metrics.register_source("sheets_mirror", mirror_stats.as_dict)
+    metrics.register_source("gpt_cache", lambda: get_completion_cache().stats())
+    return metrics.start_run(st.session_state.get("page", "🏠 ホーム"))
+
+def show_debug_panel(run):
+    if not (st.secrets.get("debug_panel", False) or st.query_params.get("debug") == "1"):
+        return
+    import pandas as pd
+
+    with st.sidebar.expander("⏱️ 計測"):
+        data = run.as_dict()
+        st.caption(f"この実行: {data['total_seconds']:.2f}秒（{data['label']}）")
+        if data["spans"]:
+            st.dataframe(pd.DataFrame([
+                {
+                    "処理": "　" * span["depth"] + span["name"],
+                    "開始(秒)": span["offset_seconds"],
+                    "所要(秒)": span["seconds"],
+                    "エラー": span["error"] or "",
+                }
+                for span in data["spans"]
+            ]), hide_index=True)
+        st.caption("これまでの集計（直近の呼び出しから p50 / p95）")
+        st.dataframe(pd.DataFrame.from_dict(metrics.summary(), orient="index").round(3))
+        counters = {**metrics.counters(), **metrics.sources()}
+        if counters:
+            st.dataframe(pd.Series(counters, name="値"))
+        st.download_button("Prometheus形式", metrics.prometheus_text(), file_name="launchtalk_metrics.txt")
+        st.download_button("JSONL（直近の実行）", metrics.export_jsonl(), file_name="launchtalk_runs.jsonl")
 
 def main():
     if "page" not in st.session_state:
         st.session_state.page = "🏠 ホーム"
 
     if st.session_state.page not in ["person_detail", "edit_topic"]:
-        selected = st.sidebar.selectbox("🚀 メニュー", ["🏠 ホーム", "🎙️ 雑談ネタ生成", "📚 TOPIC一覧", "🧑‍🤝‍🧑 話す人一覧"])
+        selected = st.sidebar.selectbox("🚀 メニュー", ["🏠 ホーム", "🎙️ 雑談ネタ生成", "📚 TOPIC一覧", "🧑‍🤝‍🧑 話す人一覧"], key="menu")
         if selected != st.session_state.page:
             st.session_state.page = selected
 
     page = st.session_state.page
 
-    try:
-        client = openai.OpenAI(api_key=OPENAI_API_KEY)
-        
-    except Exception as e:
-        st.error(f"OpenAI初期化失敗: {e}")
-        return
-
-    sheet = None
-    try:
-        sheets = init_google_sheets()
-
-        client = openai.OpenAI(api_key=OPENAI_API_KEY)
-     
-    except Exception as e:
-        st.error("初期化エラー")
-        st.write(e)
-        return  
-    except Exception as e:
-        st.warning(f"Googleスプレッドシートに接続できませんでした: {e}")
-        
+    # OpenAI とシートは、そのページで使うときだけ用意する（どちらもプロセスで1回だけ作る）
+    client = None
+    if page in ["🏠 ホーム", "🎙️ 雑談ネタ生成"]:
+        try:
+            client = get_openai_client()
+        except Exception as e:
+            st.error(f"OpenAI初期化失敗: {e}")
+            return
+        # 雑談ネタの作り置きを裏で始めておく（2回目以降はキャッシュ済みのプールを返すだけ）
+        # 作り置きは天気・ニュース・記事の取得と GPT を使うので、一覧・詳細ページでは始めない
+        get_topic_pool()
+
+    sheets = None
+    if page != "🏠 ホーム":
+        try:
+            sheets = get_sheets()
+        except Exception as e:
+            st.error("初期化エラー")
+            st.write(e)
+            return
 
     if page == "🏠 ホーム":
         show_home_page(client)
     elif page == "📚 TOPIC一覧":
-       show_topic_list_page(sheets["topics"], sheets["talk_logs"], sheets["persons"])
+       show_topic_list_page(sheets)
 
     elif page == "🎙️ 雑談ネタ生成":
         st.title("🎙️ 雑談ネタ生成")
@@ -496,37 +916,72 @@ def main():
         person_names = [p["name"] for p in group_persons]
         selected_person_name = st.selectbox("話した相手を選択：", person_names)
         person = next(p for p in group_persons if p["name"] == selected_person_name)
+        show_recommendations(sheets, person["person_id"], "generate_recommend")
 
         with st.form("generate_form"):
             mode = st.radio("ネタの種類：", ("天気ネタ", "ニュースネタ", "キーワードネタ"))
-            japan_cities = {
-            "東京": "Tokyo", "大阪": "Osaka", "名古屋": "Nagoya", "札幌": "Sapporo",
-            "福岡": "Fukuoka", "仙台": "Sendai", "広島": "Hiroshima", "那覇": "Naha",
-            "京都": "Kyoto", "横浜": "Yokohama", "神戸": "Kobe", "金沢": "Kanazawa",
-            "岡山": "Okayama-Shi", "高松": "Takamatsu-Shi"
-            }
-            selected_city_jp = st.selectbox("都市を選択（天気ネタ用）", list(japan_cities.keys()))
-            city = japan_cities[selected_city_jp]
+            selected_city_jp = st.selectbox("都市を選択（天気ネタ用）", list(JAPAN_CITIES.keys()))
+            city = JAPAN_CITIES[selected_city_jp]
             keyword = st.text_input("キーワード（キーワードネタ用）")
             submitted = st.form_submit_button("🧠 雑談ネタを生成")
 
 
         if submitted:
-            with st.spinner("生成中..."):
-                if mode.startswith("天気"):
-                    result = generate_weather_only_topic(client, city)
-                elif mode.startswith("ニュース"):
-                    result = generate_news_only_topic(client)
-                else:
-                    result = generate_keyword_topic(client, keyword)
-            
+            # 天気・ニュースは作り置きがあればそれを使う
+            # 作り置きが使えるかの確認（天気・ニュースの取得）にもステージの時間制限をかける
+            if mode.startswith("天気"):
+                pool_key, pool_timeout = ("weather", city), STAGE_TIMEOUTS["weather"]
+            elif mode.startswith("ニュース"):
+                pool_key, pool_timeout = ("news", None), STAGE_TIMEOUTS["news"]
+            else:
+                pool_key, pool_timeout = None, None
+            pooled = get_topic_pool().take(pool_key, timeout=pool_timeout) if pool_key else None
+
+            prompt = None
+            if not pooled:
+                with st.spinner("準備中..."):
+                    if mode.startswith("天気"):
+                        prompt = build_weather_prompt(city)
+                    elif mode.startswith("ニュース"):
+                        prompt = build_news_prompt()
+                    else:
+                        prompt = build_keyword_prompt(keyword)
+
+                if prompt is None:
+                    st.warning(NO_NEWS_MESSAGE)
+                    return
+
             st.markdown("### ✅ 生成された雑談ネタ")
-            st.markdown(result.replace("\n", "  \n"))
+            output = st.empty()
+            parser = TopicStreamParser()
+            saved_ids = []
+
+            # ネタが1つ閉じるたびにすぐ保存する（シートへは実行の最後にまとめて送る）
+            def save_completed(topics):
+                topic_ids, duplicates = save_topics_for_person(sheets, topics, person["person_id"])
+                saved_ids.extend(topic_ids)
+                for topic in duplicates:
+                    st.info(f"♻️ 似たネタがすでにあるため保存しませんでした：{topic['title']}")
 
             try:
-                topic_ids = save_generated_topics(sheets["topics"], result)
-                log_talk(sheets["talk_logs"], topic_ids, person["person_id"])
-                st.success("✅ topics と talk_logs に保存しました！")
+                if pooled:
+                    topics = parse_topics(pooled)
+                    output.markdown(format_topics(topics).replace("\n", "  \n"))
+                    save_completed(topics)
+                else:
+                    for delta in stream_topic(client, prompt):
+                        if delta.lstrip().startswith(GPT_ERROR):
+                            # 途中で切れた出力の残りは保存しない（閉じていたネタは保存済み）
+                            st.error(delta.strip())
+                            if saved_ids:
+                                st.warning(f"エラーまでに生成された {len(saved_ids)}件 は保存しました")
+                            return
+                        topics = parser.feed(delta)
+                        output.markdown(parser.preview().replace("\n", "  \n"))
+                        if topics:
+                            save_completed(topics)
+                    save_completed(parser.close())
+                st.success(f"✅ {len(saved_ids)}件のネタを topics と talk_logs に保存しました！")
             except Exception as e:
                 st.error("保存エラー")
                 st.write(e)
@@ -548,7 +1003,13 @@ def main():
 
 
 if __name__ == "__main__":
+    run = start_metrics_run()
+    show_layout()
     try:
         main()
     except Exception as e:
         st.error(f"アプリ実行時エラー: {e}")
+    finally:
+        flush_sheet_writes()
+        metrics.finish_run(run)
+        show_debug_panel(run)
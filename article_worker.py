@@ -0,0 +1,125 @@
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import http_client
+from response_cache import MemoryStore, ResponseCache
+
+# === ニュース本文の先読みワーカー ===
+# get_news_full で見出しが取れた時点で、各記事の本文を裏でダウンロード・解析しておく。
+# 解析（newspaper / lxml）はGILを握りっぱなしになるので別プロセスで行い、
+# 結果はURLごとにキャッシュする。ニュースネタの生成時はキャッシュを引くだけで済む。
+# 取れなかった記事（403・有料記事・本文が空など）も FAILURE_TTL の間は覚えておき、
+# 見出しを取り直すたびに同じURLへ取りに行かないようにする。
+# ダウンロードは専用のスレッド（FETCH_THREADS 本）で行い、画面の処理が使う共通のスレッドプールを
+# 先読みで埋めないようにする。先読みは画面のステージとは関係なく最後まで取る（締め切りなし）。
+
+ARTICLE_TTL = 6 * 60 * 60
+FAILURE_TTL = 30 * 60
+PARSE_PROCESSES = 2
+FETCH_THREADS = 4
+
+
+def parse_article_html(url, html):
+    # 別プロセスで実行される（モジュール直下の関数でないと渡せない）
+    from newspaper import Article
+
+    article = Article(url, language="en")
+    article.download(input_html=html)
+    article.parse()
+    return article.text.strip()
+
+
+class ArticleUnavailable(Exception):
+    pass
+
+
+class ArticleWorker:
+    def __init__(self, max_entries=256, ttl=ARTICLE_TTL, processes=PARSE_PROCESSES, failure_ttl=FAILURE_TTL,
+                 threads=FETCH_THREADS):
+        self.cache = ResponseCache(MemoryStore(max_entries=max_entries), ttl=ttl, stale_ttl=ttl)
+        self.failures = MemoryStore(max_entries=max_entries)  # url -> (失敗した時刻, エラー内容)
+        self.failure_ttl = failure_ttl
+        self.processes = processes
+        self._pool = None
+        self._fetcher = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="launchtalk-article")
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def _process_pool(self):
+        with self._lock:
+            if self._pool is None:
+                # Streamlit はスレッドを多く持つので fork ではなく spawn で起動する
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.processes, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._pool
+
+    def _parse(self, url, html):
+        try:
+            return self._process_pool().submit(parse_article_html, url, html).result()
+        except BrokenProcessPool:
+            with self._lock:
+                self._pool = None
+            return parse_article_html(url, html)
+
+    def _extract(self, url):
+        try:
+            res = http_client.get(url, endpoint="article")
+            res.raise_for_status()
+            text = self._parse(url, res.text)
+        except Exception as e:
+            self.failures.set(url, (time.time(), str(e) or type(e).__name__))
+            raise
+        if not text:
+            self.failures.set(url, (time.time(), "本文を取り出せませんでした"))
+        return text
+
+    def _recent_failure(self, url):
+        entry = self.failures.get(url)
+        if entry is None:
+            return None
+        if time.time() - entry[0] >= self.failure_ttl:
+            self.failures.delete(url)
+            return None
+        return entry[1]
+
+    def _cached_text(self, url):
+        # ARTICLE_TTL を過ぎた本文は無いものとして扱う（取り直しは _start から）
+        entry = self.cache.store.get(url)
+        if entry is None or time.time() - entry[0] >= self.cache.ttl:
+            return None
+        return entry[1]
+
+    def _start(self, url):
+        # 同じURLの取得が同時に走らないようにする
+        with self._lock:
+            future = self._inflight.get(url)
+            if future is not None:
+                return future
+            future = self._fetcher.submit(self.cache.get_or_fetch, url, lambda: self._extract(url))
+            self._inflight[url] = future
+        future.add_done_callback(lambda _: self._forget(url))
+        return future
+
+    def _forget(self, url):
+        with self._lock:
+            self._inflight.pop(url, None)
+
+    def prefetch(self, urls):
+        # 取得済みのURLと、最近取れなかったURLは飛ばす
+        for url in urls:
+            if url and self._cached_text(url) is None and self._recent_failure(url) is None:
+                self._start(url)
+
+    def get_text(self, url, timeout=None):
+        # キャッシュにあれば即返す。先読み中ならそれを待つ（失敗・時間切れは例外）
+        text = self._cached_text(url)
+        if text is not None:
+            return text
+        failure = self._recent_failure(url)
+        if failure is not None:
+            raise ArticleUnavailable(failure)
+        return self._start(url).result(timeout=timeout)
@@ -0,0 +1,248 @@
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# === 雑談ネタの一括生成（イベント前に大勢分を作っておく用） ===
+# 使い方（アプリと同じディレクトリで。.streamlit/secrets.toml を読む）:
+#   python batch_generate.py --keywords 旅行 映画 --group 2
+#   python batch_generate.py --cities Tokyo Osaka --persons 10 11 12 --concurrency 8
+#   python batch_generate.py --news --group 2 --checkpoint .cache/seed_group2.json
+# --checkpoint を指定したときだけ進捗を記録し、同じファイルを指定して再実行すれば保存済みのジョブは飛ばす。
+# （指定しなければ毎回すべてのジョブを実行する。同じ組み合わせを後日もう一度作るときも同じ）
+# 保存（シートへの書き込み）に失敗したら、まだ始まっていない生成は取り消して止める。
+# 保存は topics → talk_logs の順に送る。topics だけ送れたときは、そのジョブは保存済みとして記録し、
+# 送れなかった talk_logs の行をチェックポイントに残す（再開時に最初に送り直す）。
+
+
+class RateLimiter:
+    # 1分あたりの呼び出し回数を制限する（トークンバケット）
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(self._next, now) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+class PartialSave(Exception):
+    # topics は保存できたが、talk_logs に送れなかった行（remaining）が残った
+    def __init__(self, remaining, error):
+        super().__init__(str(error))
+        self.remaining = remaining
+
+
+def job_key(job):
+    return f"{job['kind']}:{job.get('value') or ''}:{job.get('person_id') or ''}"
+
+
+def make_jobs(keywords=(), cities=(), news=False, person_ids=()):
+    # ネタの元（キーワード・都市・ニュース）× 話す人 の組み合わせ
+    sources = [("keyword", k) for k in keywords] + [("weather", c) for c in cities]
+    if news:
+        sources.append(("news", None))
+    targets = list(person_ids) or [None]
+    return [
+        {"kind": kind, "value": value, "person_id": person_id}
+        for person_id in targets
+        for kind, value in sources
+    ]
+
+
+def load_checkpoint(path):
+    # (保存済みのジョブ, 送れなかった talk_logs の行)
+    if not path or not os.path.exists(path):
+        return set(), []
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return set(data.get("done", [])), data.get("remaining", [])
+
+
+def save_checkpoint(path, done, remaining=()):
+    if not path:
+        return
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(
+            {"done": sorted(done), "remaining": list(remaining), "updated_at": time.strftime("%Y-%m-%d %H:%M:%S")},
+            f, ensure_ascii=False,
+        )
+    os.replace(tmp, path)
+
+
+def run_batch(jobs, generate, save, concurrency=4, requests_per_minute=60,
+              checkpoint_path=None, flush_every=20, on_progress=None, resume=None):
+    # generate(job) -> GPTの出力テキスト（失敗時は例外）
+    # save([(job, テキスト), ...]) -> まとめて保存（保存できたものだけチェックポイントに記録する）
+    #   一部だけ保存できたときは PartialSave(残りの行) を投げる
+    # resume(残りの行) -> 前回の PartialSave で残った行を送る（生成を始める前に呼ぶ）
+    done, remaining = load_checkpoint(checkpoint_path)
+    pending = [job for job in jobs if job_key(job) not in done]
+    limiter = RateLimiter(requests_per_minute)
+    summary = {"total": len(jobs), "skipped": len(jobs) - len(pending), "saved": 0, "failed": []}
+    buffer = []
+
+    if remaining and resume:
+        try:
+            resume(remaining)
+        except Exception as e:
+            summary.update(aborted=str(e), unsaved=0, remaining=remaining)
+            return summary
+        remaining = []
+        save_checkpoint(checkpoint_path, done)
+
+    def limited(job):
+        limiter.wait()
+        return generate(job)
+
+    def record_saved(left=()):
+        done.update(job_key(job) for job, _ in buffer)
+        save_checkpoint(checkpoint_path, done, remaining + list(left))
+        summary["saved"] += len(buffer)
+        buffer.clear()
+
+    def flush():
+        if not buffer:
+            return
+        try:
+            save(list(buffer))
+        except PartialSave as e:
+            # ネタは保存済みなので、ジョブは済みにして残りの行だけを記録してから止める
+            summary["remaining"] = remaining + list(e.remaining)
+            record_saved(e.remaining)
+            raise
+        record_saved()
+
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="launchtalk-batch")
+    try:
+        futures = {executor.submit(limited, job): job for job in pending}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                buffer.append((job, future.result()))
+            except Exception as e:
+                summary["failed"].append({"job": job_key(job), "error": str(e)})
+            if len(buffer) >= flush_every:
+                flush()
+            if on_progress:
+                on_progress(summary["saved"] + len(buffer), len(summary["failed"]), len(pending))
+        flush()
+    except Exception as e:
+        # シートに保存できない間に生成を続けてもトークンを使うだけなので、残りは取り消す
+        summary["aborted"] = str(e)
+        summary["unsaved"] = len(buffer)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="雑談ネタを一括生成して topics / talk_logs に保存します")
+    parser.add_argument("--keywords", nargs="*", default=[], help="キーワードネタのキーワード")
+    parser.add_argument("--cities", nargs="*", default=[], help="天気ネタの都市（WeatherAPI の都市名）")
+    parser.add_argument("--news", action="store_true", help="ニュースネタも作る")
+    parser.add_argument("--persons", nargs="*", default=[], help="ネタを紐づける person_id")
+    parser.add_argument("--group", help="このグループの全員にネタを紐づける（group_id）")
+    parser.add_argument("--concurrency", type=int, default=4, help="同時に投げるGPTリクエスト数")
+    parser.add_argument("--rpm", type=int, default=60, help="1分あたりのGPTリクエスト上限")
+    parser.add_argument("--flush-every", type=int, default=20, help="何件ごとにまとめて保存するか")
+    parser.add_argument("--checkpoint", help="進捗ファイル（指定したときだけ保存済みのジョブを飛ばして再開する）")
+    args = parser.parse_args(argv)
+
+    import app
+
+    sheets = app.init_google_sheets()
+    person_ids = list(args.persons)
+    if args.group:
+        person_ids += [
+            str(p["person_id"]) for p in sheets["persons"].get_all_records()
+            if str(p["group_id"]) == str(args.group)
+        ]
+
+    jobs = make_jobs(args.keywords, args.cities, args.news, person_ids)
+    if not jobs:
+        parser.error("--keywords / --cities / --news のどれかを指定してください")
+
+    done, remaining = load_checkpoint(args.checkpoint)
+    resumed = sum(1 for job in jobs if job_key(job) in done)
+    if resumed:
+        print(f"再開: {args.checkpoint} に記録済みの {resumed}件 を飛ばします（{len(jobs) - resumed}件を実行）")
+    if remaining:
+        print(f"再開: 前回 talk_logs に送れなかった {len(remaining)}行 を先に送ります")
+
+    client = app.get_openai_client()
+    prompts = {
+        "keyword": app.build_keyword_prompt,
+        "weather": app.build_weather_prompt,
+        "news": lambda _: app.build_news_prompt(),
+    }
+
+    def generate(job):
+        prompt = prompts[job["kind"]](job["value"])
+        if prompt is None:
+            raise RuntimeError(app.NO_NEWS_MESSAGE)
+        text = app.request_completion(client, prompt)[0]
+        if not app.parse_topics(text):
+            raise RuntimeError("GPTの出力からネタを読み取れませんでした")
+        return text
+
+    def save(results):
+        links = []
+        for job, text in results:
+            if job["person_id"] is None:
+                app.save_generated_topics(sheets["topics"], text)
+            else:
+                # その人にすでにある似たネタは保存しない
+                topic_ids, _ = app.save_topics_for_person(sheets, app.parse_topics(text), job["person_id"])
+                links += [[str(topic_id), str(job["person_id"])] for topic_id in topic_ids]
+        # topics / talk_logs ともに append_rows 1回ずつで送る。紐づけ先のネタが先にシートにあるよう topics から
+        sheets["topics"].flush()
+        try:
+            sheets["talk_logs"].flush()
+        except Exception as e:
+            raise PartialSave(links, e) from e
+
+    def resend(rows):
+        sheets["talk_logs"].append_rows(rows)
+        sheets["talk_logs"].flush()
+
+    def progress(saved, failed, total):
+        print(f"\r生成 {saved + failed}/{total}（失敗 {failed}）", end="", flush=True)
+
+    summary = run_batch(
+        jobs, generate, save,
+        concurrency=args.concurrency,
+        requests_per_minute=args.rpm,
+        checkpoint_path=args.checkpoint,
+        flush_every=args.flush_every,
+        on_progress=progress,
+        resume=resend,
+    )
+    print()
+    print(f"保存 {summary['saved']}件 / スキップ {summary['skipped']}件 / 失敗 {len(summary['failed'])}件")
+    for failure in summary["failed"]:
+        print(f"  失敗: {failure['job']}: {failure['error']}")
+    if "aborted" in summary:
+        print(f"保存に失敗したため中断しました（未保存 {summary['unsaved']}件）: {summary['aborted']}")
+    if summary.get("remaining"):
+        # topics は保存済みで、talk_logs への紐づけだけが送れていない行
+        where = f"{args.checkpoint} に記録しました（同じ --checkpoint で再実行すると送り直します）" if args.checkpoint else "記録していません"
+        print(f"talk_logs に送れなかった行（topic_id, person_id） {len(summary['remaining'])}件 を{where}:")
+        for topic_id, person_id in summary["remaining"]:
+            print(f"  {topic_id}, {person_id}")
+    return 1 if summary["failed"] or "aborted" in summary else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,632 @@
+import argparse
+import gc
+import json
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import types
+
+# === オフラインのベンチマーク（APIキー不要） ===
+# OpenAI / NewsAPI / WeatherAPI / Google Sheets を、bench_fixtures/ に記録したレスポンスを
+# 返す代わりの実装に差し替え、各呼び出しに遅延を入れたうえで、ページを AppTest で動かす。
+# 100 / 1万 / 10万件の topics・talk_logs を作り、ページごとの初回・2回目以降の時間と
+# メモリ、スパンごとの p50 / p95 を出す。
+# 使い方（アプリと同じディレクトリで）:
+#   python benchmark.py                               # 100 / 10000 / 100000 件
+#   python benchmark.py --sizes 100 10000 --repeat 5 --latency-scale 0.5
+#   python benchmark.py --json .cache/bench.json      # 結果を保存
+#   python benchmark.py --compare .cache/bench.json   # 保存した結果より 25% 以上遅ければ終了コード 1
+#   python benchmark.py --cold-start --sizes 10000    # 新しいプロセスでの import 時間とページごとの初回表示
+#   python benchmark.py --record                      # secrets.toml のキーで天気・ニュース・記事を取り直す
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_fixtures")
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+DEFAULT_SIZES = [100, 10000, 100000]
+
+# 1回の呼び出しにかかる遅延（秒）。本番でおおよそ見えている値
+LATENCY = {
+    "sheets.open": 0.4,
+    "sheets.read": 0.5,
+    "sheets.read_row": 0.00002,  # 取得する1行ごとに増える分（10万行で約2秒）
+    "sheets.write": 0.3,
+    "weatherapi": 0.15,
+    "newsapi": 0.25,
+    "article": 0.3,
+    "openai": 1.0,
+    "openai.chunk": 0.02,
+}
+
+CATEGORIES = ["天気", "時事", "グルメ", "旅行", "趣味", "暮らし", "科学", "スポーツ"]
+WORDS = ["梅雨", "花火", "紅葉", "温泉", "自転車", "パン", "映画", "将棋", "登山", "カレー", "図書館", "猫"]
+
+# import 時に読み込まれていないほうがよい重いライブラリ
+HEAVY_MODULES = ["openai", "pandas", "gspread", "oauth2client", "google.oauth2", "newspaper", "numpy"]
+
+PAGES = {
+    "home": "🏠 ホーム",
+    "topic_list": "📚 TOPIC一覧",
+    "persons_list": "🧑‍🤝‍🧑 話す人一覧",
+    "person_detail": "person_detail",
+    "generate": "🎙️ 雑談ネタ生成",
+}
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURE_DIR, name), encoding="utf-8") as f:
+        return f.read() if name.endswith(".html") else json.load(f)
+
+
+class Latency:
+    def __init__(self, scale=1.0):
+        self.scale = scale
+
+    def wait(self, kind, times=1):
+        delay = LATENCY[kind] * self.scale * times
+        if delay > 0:
+            time.sleep(delay)
+
+
+# === 合成データ ===
+def make_dataset(size, seed=0):
+    rng = random.Random(seed)
+    num_persons = max(10, size // 200)
+    num_groups = 5
+    groups = [["group_id", "group_name"]] + [[g, f"グループ{g}"] for g in range(1, num_groups + 1)]
+    persons = [["person_id", "name", "group_id"]] + [
+        [p, f"話す人{p}", rng.randint(1, num_groups)] for p in range(1, num_persons + 1)
+    ]
+    topics = [["topic_id", "created_at", "title", "category", "content"]]
+    for t in range(1, size + 1):
+        word = rng.choice(WORDS)
+        day = f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:00:00"
+        topics.append([t, day, f"{word}の話 その{t}", rng.choice(CATEGORIES),
+                       f"{word}について{rng.choice(WORDS)}や{rng.choice(WORDS)}と絡めて話してみましょう（{t}）"])
+    talk_logs = [["topic_id", "person_id", "talked"]] + [
+        [rng.randint(1, size), rng.randint(1, num_persons), rng.choice(["TRUE", "FALSE", ""])]
+        for _ in range(size)
+    ]
+    return {"topics": topics, "groups": groups, "persons": persons, "talk_logs": talk_logs}
+
+
+# === Google Sheets の代わり ===
+class FakeWorksheet:
+    def __init__(self, title, values, latency):
+        self.title = title
+        self.values = [[str(v) for v in row] for row in values]
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _call(self, kind):
+        self.calls += 1
+        self.latency.wait(kind)
+
+    def get_all_values(self, **kwargs):
+        self._call("sheets.read")
+        with self._lock:
+            values = [list(row) for row in self.values]
+        self.latency.wait("sheets.read_row", len(values))
+        return values
+
+    def get_all_records(self, **kwargs):
+        values = self.get_all_values()
+        return [dict(zip(values[0], row)) for row in values[1:]] if values else []
+
+    def row_values(self, row, **kwargs):
+        self._call("sheets.read")
+        with self._lock:
+            return list(self.values[row - 1]) if row <= len(self.values) else []
+
+    def col_values(self, col, **kwargs):
+        self._call("sheets.read")
+        with self._lock:
+            return [row[col - 1] for row in self.values if len(row) >= col]
+
+    def get(self, range_name=None, **kwargs):
+        from gspread.utils import a1_range_to_grid_range
+
+        self._call("sheets.read")
+        grid = a1_range_to_grid_range(range_name)
+        with self._lock:
+            rows = self.values[grid.get("startRowIndex", 0):grid.get("endRowIndex")]
+            values = [row[grid.get("startColumnIndex", 0):grid.get("endColumnIndex")] for row in rows]
+        self.latency.wait("sheets.read_row", len(values))
+        return values
+
+    def append_row(self, values, **kwargs):
+        self.append_rows([values])
+
+    def append_rows(self, values, **kwargs):
+        self._call("sheets.write")
+        with self._lock:
+            self.values += [[str(v) for v in row] for row in values]
+
+    def _write(self, range_name, values):
+        from gspread.utils import a1_range_to_grid_range
+
+        grid = a1_range_to_grid_range(range_name)
+        top = grid.get("startRowIndex", 0)
+        left = grid.get("startColumnIndex", 0)
+        for offset, row in enumerate(values):
+            while len(self.values) <= top + offset:
+                self.values.append([])
+            target = self.values[top + offset]
+            if len(target) < left + len(row):
+                target += [""] * (left + len(row) - len(target))
+            target[left:left + len(row)] = [str(v) for v in row]
+
+    def update(self, values=None, range_name=None, **kwargs):
+        self._call("sheets.write")
+        with self._lock:
+            if range_name is None:
+                self.values = [[str(v) for v in row] for row in values]
+            else:
+                self._write(range_name, values)
+
+    def batch_update(self, data, **kwargs):
+        self._call("sheets.write")
+        with self._lock:
+            for item in data:
+                self._write(item["range"], item["values"])
+
+    def batch_clear(self, ranges):
+        self._call("sheets.write")
+
+
+class FakeSpreadsheet:
+    def __init__(self, data, latency):
+        self.tables = {name: FakeWorksheet(name, values, latency) for name, values in data.items()}
+        self.latency = latency
+
+    def worksheet(self, name):
+        self.latency.wait("sheets.open")
+        return self.tables[name]
+
+    def worksheets(self):
+        self.latency.wait("sheets.open")
+        return list(self.tables.values())
+
+
+class FakeGspreadClient:
+    def __init__(self, spreadsheet):
+        self.spreadsheet = spreadsheet
+
+    def open_by_key(self, key):
+        return self.spreadsheet
+
+
+# === NewsAPI / WeatherAPI / 記事ページの代わり（http_client のセッションを差し替える） ===
+class FakeResponse:
+    def __init__(self, url, status_code=200, data=None, text=""):
+        self.url = url
+        self.status_code = status_code
+        self._data = data
+        self.text = text if data is None else json.dumps(data, ensure_ascii=False)
+        self.headers = {}
+
+    def json(self):
+        return self._data if self._data is not None else json.loads(self.text)
+
+    def raise_for_status(self):
+        import requests
+
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} for {self.url}", response=self)
+
+
+class FakeSession:
+    def __init__(self, latency):
+        self.latency = latency
+        self.headers = {}
+        self.weather = load_fixture("weather_forecast.json")
+        self.news = load_fixture("newsapi_top_headlines.json")
+        self.article = load_fixture("article.html")
+
+    def get(self, url, params=None, timeout=None, **kwargs):
+        if "weatherapi.com" in url:
+            self.latency.wait("weatherapi")
+            return FakeResponse(url, data=self.weather)
+        if "newsapi.org" in url:
+            self.latency.wait("newsapi")
+            return FakeResponse(url, data=self.news)
+        self.latency.wait("article")
+        return FakeResponse(url, text=self.article)
+
+
+# === OpenAI の代わり ===
+class FakeCompletions:
+    def __init__(self, latency):
+        self.latency = latency
+        self.fixture = load_fixture("openai_completions.json")
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def _content(self, prompt):
+        if "雑談ネタ" in prompt:
+            with self._lock:
+                topics = self.fixture["topics"]
+                content = topics[self._next % len(topics)]
+                self._next += 1
+            return content
+        if "要約" in prompt:
+            return self.fixture["summary"]
+        return self.fixture["translation"]
+
+    def _usage(self):
+        usage = self.fixture["usage"]
+        return types.SimpleNamespace(
+            prompt_tokens=usage["prompt_tokens"],
+            completion_tokens=usage["completion_tokens"],
+            total_tokens=usage["prompt_tokens"] + usage["completion_tokens"],
+        )
+
+    def _json_content(self, name, prompt):
+        # JSON スキーマ指定のリクエストには、記録したテキストを同じ内容の JSON にして返す
+        from topic_parser import parse_topics
+
+        if name == "topics":
+            return json.dumps({"topics": parse_topics(self._content(prompt))}, ensure_ascii=False)
+        items = json.loads(prompt[prompt.index("{"):])["items"]
+        title, _, description = self.fixture["translation"].partition("\n")
+        return json.dumps(
+            {"items": [{"id": item["id"], "title": title, "description": description} for item in items]},
+            ensure_ascii=False,
+        )
+
+    def create(self, model=None, messages=None, stream=False, response_format=None, **kwargs):
+        prompt = messages[-1]["content"]
+        if response_format:
+            content = self._json_content(response_format["json_schema"]["name"], prompt)
+        else:
+            content = self._content(prompt)
+        if not stream:
+            self.latency.wait("openai")
+            message = types.SimpleNamespace(content=content)
+            return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)], usage=self._usage())
+
+        def chunks():
+            self.latency.wait("openai", 0.3)  # 最初のトークンまで
+            for i in range(0, len(content), 8):
+                self.latency.wait("openai.chunk")
+                delta = types.SimpleNamespace(content=content[i:i + 8])
+                yield types.SimpleNamespace(choices=[types.SimpleNamespace(delta=delta)], usage=None)
+            yield types.SimpleNamespace(choices=[], usage=self._usage())
+
+        return chunks()
+
+
+class FakeOpenAI:
+    def __init__(self, latency):
+        self.chat = types.SimpleNamespace(completions=FakeCompletions(latency))
+
+
+def install_fakes(data, latency):
+    # アプリが使う外部クライアントをすべて差し替える（差し替えた Sheets を返す）
+    import gspread
+    import openai
+    from oauth2client.service_account import ServiceAccountCredentials
+
+    import http_client
+
+    spreadsheet = FakeSpreadsheet(data, latency)
+    gspread.authorize = lambda credentials: FakeGspreadClient(spreadsheet)
+    ServiceAccountCredentials.from_json_keyfile_dict = classmethod(lambda cls, *args, **kwargs: None)
+    http_client._session = FakeSession(latency)
+    openai.OpenAI = lambda **kwargs: FakeOpenAI(latency)
+    return spreadsheet
+
+
+def write_secrets(workdir):
+    # 作業ディレクトリに .streamlit/secrets.toml を置く
+    # （記事解析の子プロセスも app.py を読み込むので、AppTest の secrets ではなくファイルで渡す）
+    secrets = bench_secrets(workdir)
+    lines = []
+    tables = []
+    for key, value in secrets.items():
+        if isinstance(value, dict):
+            tables.append((key, value))
+        else:
+            lines.append(f"{key} = {json.dumps(value, ensure_ascii=False)}")
+    for name, table in tables:
+        lines.append(f"[{name}]")
+        lines += [f"{key} = {json.dumps(value, ensure_ascii=False)}" for key, value in table.items()]
+    os.makedirs(os.path.join(workdir, ".streamlit"), exist_ok=True)
+    with open(os.path.join(workdir, ".streamlit", "secrets.toml"), "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def bench_secrets(workdir):
+    account_keys = [
+        "type", "project_id", "private_key_id", "private_key", "client_email", "client_id",
+        "auth_uri", "token_uri", "auth_provider_x509_cert_url", "client_x509_cert_url",
+    ]
+    return {
+        "openai_api_key": "bench",
+        "news_api_key": "bench",
+        "weather_api_key": "bench",
+        "spreadsheet_id": "bench",
+        "gcp_service_account": {key: "bench" for key in account_keys},
+        "storage_backend": "sheets",
+        "gpt_cache_backend": "memory",
+        "response_cache_backend": "memory",
+        # 作り置きは計測の邪魔になるので止める（ホーム・生成ページの数字には、本番で裏に走る
+        # 作り置きの天気・ニュース・記事の取得と GPT 呼び出しが入っていない）
+        "topic_pool_tokens_per_hour": 0,
+        "id_allocator_path": os.path.join(workdir, ".cache", "id_allocator.json"),
+    }
+
+
+# === 計測 ===
+def busiest_person(data):
+    counts = {}
+    for row in data["talk_logs"][1:]:
+        counts[row[1]] = counts.get(row[1], 0) + 1
+    return int(max(counts, key=counts.get)) if counts else 1
+
+
+def new_app_test(page, state):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_PATH, default_timeout=600)
+    for key, value in state.items():
+        at.session_state[key] = value
+    at.session_state["page"] = page
+    if page in PAGES.values() and page not in ("person_detail", "edit_topic"):
+        at.session_state["menu"] = page
+    return at
+
+
+def run_once(at, action=None):
+    started = time.perf_counter()
+    if action is None:
+        at.run()
+    else:
+        action(at)
+    elapsed = time.perf_counter() - started
+    errors = [e.value for e in at.error] + [str(e.value) for e in at.exception]
+    return elapsed, errors
+
+
+def click_generate(at):
+    [b for b in at.button if "雑談ネタを生成" in b.label][0].click().run()
+
+
+def measure_page(name, state, repeat, trace_memory):
+    page = PAGES[name]
+    at = new_app_test(page, state)
+    if trace_memory:
+        tracemalloc.start()
+    cold, errors = run_once(at)
+    peak = tracemalloc.get_traced_memory()[1] if trace_memory else 0
+    warm = []
+    for _ in range(repeat):
+        elapsed, run_errors = run_once(at, click_generate if name == "generate" else None)
+        warm.append(elapsed)
+        errors += run_errors
+        if trace_memory:
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+    if trace_memory:
+        tracemalloc.stop()
+    return {
+        "cold_seconds": cold,
+        "warm_p50_seconds": statistics.median(warm) if warm else None,
+        "warm_max_seconds": max(warm) if warm else None,
+        "peak_mb": peak / 1024 / 1024,
+        "errors": sorted(set(errors)),
+    }
+
+
+def bench_size(size, pages, repeat, latency_scale, trace_memory):
+    import streamlit as st
+
+    from metrics import metrics
+
+    data = make_dataset(size)
+    person_id = busiest_person(data)
+    install_fakes(data, Latency(latency_scale))
+    metrics.reset()
+    results = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        # .cache/ などはこの作業ディレクトリに作られ、終わったら消える
+        write_secrets(workdir)
+        os.chdir(workdir)
+        try:
+            for name in pages:
+                # 各ページを「プロセスを立ち上げ直した直後」から測る
+                st.cache_resource.clear()
+                st.cache_data.clear()
+                gc.collect()
+                results[name] = measure_page(name, {"selected_person_id": person_id}, repeat, trace_memory)
+                print(f"  {name:<14} 初回 {results[name]['cold_seconds']:7.3f}秒  "
+                      f"2回目以降 {results[name]['warm_p50_seconds'] or 0:7.3f}秒  "
+                      f"ピーク {results[name]['peak_mb']:8.1f}MB"
+                      + (f"  エラー {results[name]['errors'][:1]}" if results[name]["errors"] else ""),
+                      flush=True)
+        finally:
+            os.chdir(cwd)
+    return {"pages": results, "spans": metrics.summary()}
+
+
+def measure_sync(size, latency_scale, appended=20):
+    # TTL 切れの読み直しで、末尾に appended 行増えたときの時間（差分取得と毎回全件取得）
+    from sheet_cache import DEFAULT_FULL_SYNC_INTERVAL, CachedWorksheet
+
+    data = make_dataset(size)
+    result = {}
+    for mode, interval in (("incremental", DEFAULT_FULL_SYNC_INTERVAL), ("full", 0)):
+        worksheet = FakeWorksheet("talk_logs", data["talk_logs"], Latency(latency_scale))
+        cached = CachedWorksheet(worksheet, ttl=0, full_sync_interval=interval)
+        cached.get_all_records()
+        worksheet.append_rows([[1, 1, "FALSE"]] * appended)
+        started = time.perf_counter()
+        cached.get_all_records()
+        result[f"{mode}_seconds"] = time.perf_counter() - started
+    return result
+
+
+def compare(report, baseline, threshold):
+    # 同じ件数・ページで、基準より threshold 倍以上遅くなったものを返す
+    regressions = []
+    for size, result in report["sizes"].items():
+        base = baseline.get("sizes", {}).get(size)
+        if not base:
+            continue
+        for page, stat in result["pages"].items():
+            base_stat = base["pages"].get(page)
+            if not base_stat:
+                continue
+            for key in ("cold_seconds", "warm_p50_seconds"):
+                if stat.get(key) and base_stat.get(key) and stat[key] > base_stat[key] * threshold:
+                    regressions.append(f"{size}件 {page} {key}: {base_stat[key]:.3f} -> {stat[key]:.3f}")
+    return regressions
+
+
+# === コールドスタート（新しいプロセスで測る） ===
+IMPORT_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {app_dir!r})
+import app
+elapsed = time.perf_counter() - started
+print("BENCH_JSON " + json.dumps({{"seconds": elapsed, "modules": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def _run_child(args, workdir):
+    output = subprocess.run(args, cwd=workdir, capture_output=True, text=True, check=False).stdout
+    for line in reversed(output.splitlines()):
+        if line.startswith("BENCH_JSON "):
+            return json.loads(line[len("BENCH_JSON "):])
+    raise RuntimeError(f"子プロセスの結果を読めませんでした: {' '.join(args)}")
+
+
+def measure_import(repeat):
+    # app を import するだけの時間（Streamlit が起動直後・記事解析の子プロセスが払う分）
+    script = IMPORT_SCRIPT.format(app_dir=os.path.dirname(APP_PATH), heavy=HEAVY_MODULES)
+    with tempfile.TemporaryDirectory() as workdir:
+        write_secrets(workdir)
+        runs = [_run_child([sys.executable, "-c", script], workdir) for _ in range(repeat)]
+    return {"seconds": statistics.median(r["seconds"] for r in runs), "modules": runs[0]["modules"]}
+
+
+def measure_cold_pages(size, pages, latency_scale):
+    # ページごとに新しいプロセスを立ち上げ、最初の1回の表示にかかる時間を測る
+    # （差し替えのために gspread / openai は先に読み込むので、その import 時間は含まない）
+    results = {}
+    for name in pages:
+        args = [sys.executable, os.path.abspath(__file__), "--cold-page", name,
+                "--sizes", str(size), "--latency-scale", str(latency_scale)]
+        results[name] = _run_child(args, os.getcwd())["cold_seconds"]
+        print(f"  {name:<14} 初回表示 {results[name]:7.3f}秒", flush=True)
+    return results
+
+
+# === 記録（実際のAPIからフィクスチャを取り直す） ===
+def record_fixtures():
+    import streamlit as st
+
+    import http_client
+
+    weather = http_client.get_json(
+        "http://api.weatherapi.com/v1/forecast.json",
+        params={"key": st.secrets["weather_api_key"], "q": "Tokyo", "lang": "ja", "days": 1},
+    )
+    news = http_client.get_json(
+        "https://newsapi.org/v2/top-headlines",
+        params={"country": "us", "apiKey": st.secrets["news_api_key"]},
+    )
+    news["articles"] = news.get("articles", [])[:5]
+    news["totalResults"] = len(news["articles"])
+    article = http_client.get(news["articles"][0]["url"]).text if news["articles"] else None
+
+    for name, value in [("weather_forecast.json", weather), ("newsapi_top_headlines.json", news)]:
+        with open(os.path.join(FIXTURE_DIR, name), "w", encoding="utf-8") as f:
+            json.dump(value, f, ensure_ascii=False, indent=1)
+    if article:
+        with open(os.path.join(FIXTURE_DIR, "article.html"), "w", encoding="utf-8") as f:
+            f.write(article)
+    print(f"{FIXTURE_DIR} に記録しました")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="外部APIを記録済みレスポンスに差し替えてページの速度を測ります")
+    parser.add_argument("--sizes", nargs="*", type=int, default=DEFAULT_SIZES, help="topics / talk_logs の件数")
+    parser.add_argument("--pages", nargs="*", choices=list(PAGES), default=list(PAGES), help="測るページ")
+    parser.add_argument("--repeat", type=int, default=3, help="2回目以降の実行を何回測るか")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="遅延の倍率（0 で遅延なし）")
+    parser.add_argument("--no-memory", action="store_true", help="tracemalloc を使わない（速いがメモリは出ない）")
+    parser.add_argument("--json", help="結果を保存するファイル")
+    parser.add_argument("--compare", help="基準にする結果ファイル（--json で保存したもの）")
+    parser.add_argument("--threshold", type=float, default=1.25, help="基準の何倍で遅くなったとみなすか")
+    parser.add_argument("--cold-start", action="store_true", help="新しいプロセスでの import 時間と初回表示を測る")
+    parser.add_argument("--record", action="store_true", help="secrets.toml のキーで天気・ニュース・記事を記録し直す")
+    parser.add_argument("--cold-page", choices=list(PAGES), help=argparse.SUPPRESS)  # --cold-start の子プロセス用
+    args = parser.parse_args(argv)
+
+    if args.record:
+        record_fixtures()
+        return 0
+    if args.cold_page:
+        result = bench_size(args.sizes[0], [args.cold_page], 0, args.latency_scale, False)
+        print("BENCH_JSON " + json.dumps(result["pages"][args.cold_page], ensure_ascii=False))
+        return 0
+    if args.cold_start:
+        report = {"import": measure_import(args.repeat), "sizes": {}}
+        print(f"import app: {report['import']['seconds']:.3f}秒  読み込まれた重いライブラリ: "
+              f"{', '.join(report['import']['modules']) or 'なし'}")
+        for size in args.sizes:
+            print(f"== {size}件 ==", flush=True)
+            report["sizes"][str(size)] = measure_cold_pages(size, args.pages, args.latency_scale)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=1)
+        return 0
+
+    report = {
+        "started_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": sys.version.split()[0],
+        "latency_scale": args.latency_scale,
+        "repeat": args.repeat,
+        "sizes": {},
+    }
+    for size in args.sizes:
+        print(f"== {size}件 ==", flush=True)
+        report["sizes"][str(size)] = bench_size(size, args.pages, args.repeat, args.latency_scale, not args.no_memory)
+        sync = report["sizes"][str(size)]["sync"] = measure_sync(size, args.latency_scale)
+        print(f"  {'sheet_sync':<14} 差分 {sync['incremental_seconds']:7.3f}秒  全件 {sync['full_seconds']:7.3f}秒"
+              "（20行追加後の読み直し）", flush=True)
+    report["max_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    print(f"最大RSS {report['max_rss_mb']:.1f}MB")
+    print("スパンごと（最後の件数）:")
+    last = report["sizes"][str(args.sizes[-1])]["spans"] if args.sizes else {}
+    for name, stat in last.items():
+        print(f"  {name:<24} {stat['calls']:>6}回  p50 {stat['p50_seconds']:.3f}秒  p95 {stat['p95_seconds']:.3f}秒")
+
+    if args.json:
+        directory = os.path.dirname(args.json)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+
+    failed = any(page["errors"] for result in report["sizes"].values() for page in result["pages"].values())
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for line in regressions:
+            print(f"遅くなりました: {line}")
+        failed = failed or bool(regressions)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,30 @@
+import re
+
+# === 似たネタの重複チェック（文字3-gram の Jaccard 類似度、ネットワーク不要） ===
+# タイトルと内容を文字3-gramにして比べる。重複として扱うのは「同じ人にすでに紐づいているネタ」と
+# ほぼ同じものだけなので、比べる相手はその人のネタ（多くても数十〜数百件）に限られ、
+# topics 全体の件数が何万件あっても比較の回数は増えない。
+
+SHINGLE_SIZE = 3
+
+
+def normalize(text):
+    # 記号・空白を落として小文字に
+    return re.sub(r"[\W_]+", "", str(text)).lower()
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    text = normalize(text)
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def topic_text(topic):
+    return f"{topic.get('title', '')} {topic.get('content', '')}"
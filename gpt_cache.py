@@ -0,0 +1,57 @@
+import hashlib
+import json
+import threading
+import time
+
+# === GPT応答キャッシュ（model・messages・パラメータのハッシュをキーにする） ===
+# 同じ見出しの翻訳や同じ概要の要約は、2回目以降トークンを使わずに返す。
+# 保存先は response_cache の MemoryStore / DiskStore（LRU・件数上限付き）を使う。
+
+
+class CompletionCache:
+    def __init__(self, store, ttl=7 * 24 * 60 * 60):
+        self.store = store
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        self.tokens_saved = 0
+
+    @staticmethod
+    def key_for(model, messages, **params):
+        payload = json.dumps(
+            {"model": model, "messages": messages, "params": params},
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return "gpt:" + hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        entry = self.store.get(key)
+        with self._lock:
+            if entry is None or time.time() - entry[0] >= self.ttl:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.tokens_saved += entry[2]
+            return entry[1]
+
+    def set(self, key, content, tokens=0):
+        self.store.set(key, (time.time(), content, tokens))
+
+    def record_bypass(self):
+        with self._lock:
+            self.bypasses += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypasses": self.bypasses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "tokens_saved": self.tokens_saved,
+                "entries": len(self.store),
+            }
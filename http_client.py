@@ -0,0 +1,136 @@
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError
+from urllib3.util.retry import Retry
+
+from metrics import span
+from workers import stage_deadline
+
+# === 外部API用の共通HTTPクライアント（プロセスで1つ） ===
+# - 接続プール（keep-alive）でTCP/TLSのハンドシェイクを使い回す
+# - ホストごとの同時接続数を制限
+# - 接続・読み込みのタイムアウト
+# - 429/5xx はジッター付きバックオフでリトライ
+# - 時間制限付きのステージから呼ばれたときは、締め切りの残り時間でタイムアウトを縮め、
+#   締め切りまでに終わらないリトライはしない
+# - エンドポイントごとのレイテンシ・エラー数を記録
+
+CONNECT_TIMEOUT = 3.05
+READ_TIMEOUT = 10
+POOL_SIZE = 16
+PER_HOST_LIMIT = 4
+USER_AGENT = "LaunchTalk/1.0 (+https://github.com/tachi57613/sourcetree_test)"
+
+class DeadlineRetry(Retry):
+    # 次の待ち時間（バックオフ・Retry-After）のあいだに締め切りが来るならリトライをやめる
+    # increment は呼び出し元のスレッドで呼ばれるので、締め切りはそのスレッドのものを見る
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        retry = super().increment(method, url, response, error, _pool, _stacktrace)
+        deadline = stage_deadline()
+        if deadline is not None:
+            delay = retry.get_backoff_time()
+            if response is not None and self.respect_retry_after_header:
+                delay = max(delay, retry.get_retry_after(response) or 0)
+            if time.monotonic() + delay >= deadline:
+                raise MaxRetryError(_pool, url, error)
+        return retry
+
+
+_retry = DeadlineRetry(
+    total=3,
+    connect=2,
+    read=2,
+    status=3,
+    backoff_factor=0.5,
+    backoff_jitter=0.3,
+    status_forcelist=(429, 500, 502, 503, 504),
+    allowed_methods=frozenset(["GET", "HEAD"]),
+    respect_retry_after_header=True,
+    raise_on_status=False,
+)
+
+_session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=_retry)
+_session.mount("http://", _adapter)
+_session.mount("https://", _adapter)
+_session.headers["User-Agent"] = USER_AGENT
+
+_host_limits = {}
+_host_limits_lock = threading.Lock()
+
+
+def _host_semaphore(host):
+    with _host_limits_lock:
+        if host not in _host_limits:
+            _host_limits[host] = threading.BoundedSemaphore(PER_HOST_LIMIT)
+        return _host_limits[host]
+
+
+# === エンドポイントごとの統計 ===
+class EndpointStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, endpoint, elapsed, error):
+        with self._lock:
+            stat = self._stats.setdefault(
+                endpoint, {"requests": 0, "errors": 0, "total_seconds": 0.0, "max_seconds": 0.0}
+            )
+            stat["requests"] += 1
+            stat["errors"] += 1 if error else 0
+            stat["total_seconds"] += elapsed
+            stat["max_seconds"] = max(stat["max_seconds"], elapsed)
+
+    def as_dict(self):
+        with self._lock:
+            result = {}
+            for endpoint, stat in self._stats.items():
+                result[endpoint] = dict(stat, avg_seconds=stat["total_seconds"] / stat["requests"])
+            return result
+
+
+endpoint_stats = EndpointStats()
+
+
+def get(url, params=None, endpoint=None, timeout=None, **kwargs):
+    # endpoint を省略した場合は「ホスト + パス」で集計する
+    parts = urlsplit(url)
+    endpoint = endpoint or f"{parts.netloc}{parts.path}"
+    timeout = timeout or (CONNECT_TIMEOUT, READ_TIMEOUT)
+    deadline = stage_deadline()
+
+    started = time.monotonic()
+    error = True
+    try:
+        with span(f"http.{endpoint}") as s:
+            semaphore = _host_semaphore(parts.netloc)
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not semaphore.acquire(timeout=remaining):
+                    raise requests.Timeout(f"{endpoint}: 締め切りまでに送れませんでした")
+                remaining = max(deadline - time.monotonic(), 0.01)
+                connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+                timeout = (min(connect, remaining), min(read, remaining))
+            else:
+                semaphore.acquire()
+            try:
+                response = _session.get(url, params=params, timeout=timeout, **kwargs)
+            finally:
+                semaphore.release()
+            error = response.status_code >= 400
+            if error:
+                s.fail(f"HTTP {response.status_code}")
+        return response
+    finally:
+        endpoint_stats.record(endpoint, time.monotonic() - started, error)
+
+
+def get_json(url, params=None, endpoint=None, timeout=None, **kwargs):
+    response = get(url, params=params, endpoint=endpoint, timeout=timeout, **kwargs)
+    response.raise_for_status()
+    return response.json()
@@ -0,0 +1,69 @@
+import json
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows ではプロセス間のロックなし
+    fcntl = None
+
+# === ID の払い出し（topic_id / person_id） ===
+# 保存のたびに列を全件読んで max を取る代わりに、
+# プロセスごとに ID をまとめて（lease_size 個ずつ）借りておき、そこから1つずつ渡す。
+#   - 借りた範囲の上限（high-water mark）はファイルに保存し、ファイルロックで
+#     同じマシンの別プロセスとも重ならないようにする
+#   - 借りるたびに既存データの最大ID（seed）も見直し、ファイルの上限と大きい方から借りる
+#     （手で足された行や別のマシンから書かれた行の ID を越えるため）
+#   - 重ならないと言えるのは同じマシンの中だけ。別のマシンとは借りてから使い切るまでの
+#     間（lease_size 個ぶん）に同じ ID を取り合う可能性が残る
+#   - 使わずに終わった ID は欠番になる（番号は増える一方で、詰めはしない）
+
+
+class IdAllocator:
+    def __init__(self, path, name, seed=None, lease_size=20):
+        # seed() -> 既存データの最大ID（借りるたびに呼ぶ）
+        self.path = path
+        self.name = name
+        self.seed = seed
+        self.lease_size = lease_size
+        self._next = 0
+        self._end = 0  # この値の手前まで払い出せる
+        self._lock = threading.Lock()
+
+    def _lease(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        floor = int(self.seed() or 0) if self.seed else 0
+        with open(self.path, "a+", encoding="utf-8") as f:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                text = f.read()
+                marks = json.loads(text) if text.strip() else {}
+                start = max(int(marks.get(self.name, 0)), floor) + 1
+                marks[self.name] = start + self.lease_size - 1
+                f.seek(0)
+                f.truncate()
+                json.dump(marks, f)
+                f.flush()
+                os.fsync(f.fileno())
+            finally:
+                if fcntl:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+        self._next = start
+        self._end = start + self.lease_size
+
+    def allocate(self):
+        with self._lock:
+            if self._next >= self._end:
+                self._lease()
+            value = self._next
+            self._next += 1
+            return value
+
+
+def max_numeric(values):
+    ids = [int(v) for v in values if str(v).isdigit()]
+    return max(ids) if ids else 0
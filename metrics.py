@@ -0,0 +1,269 @@
+import contextvars
+import functools
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# === 処理時間の計測（スパン・カウンター・トークン数） ===
+# Sheets / NewsAPI / WeatherAPI / 記事本文 / OpenAI の呼び出しをスパンで囲み、
+#   - 1回の実行（rerun）ごとの内訳
+#   - スパン名ごとの回数・失敗数・p50 / p95
+#   - トークン数などのカウンター
+# を記録する。結果はサイドバーのデバッグ表示・JSONL・Prometheus 形式で取り出せる。
+# スパンの親子関係と「どの実行の処理か」は contextvars で持つ
+# （workers.submit がコンテキストを引き継ぐので、スレッドに投げた処理も同じ実行に入る）。
+
+SAMPLE_SIZE = 1000  # スパン名ごとに p50 / p95 を出すために残す件数
+RECENT_RUNS = 50
+
+_current_span = contextvars.ContextVar("launchtalk_span", default=None)
+_current_run = contextvars.ContextVar("launchtalk_run", default=None)
+
+
+class Span:
+    def __init__(self, name, parent, attrs):
+        self.name = name
+        self.parent = parent
+        self.depth = parent.depth + 1 if parent else 0
+        self.attrs = attrs
+        self.started = time.monotonic()
+        self.elapsed = None
+        self.error = None
+
+    def fail(self, error):
+        self.error = str(error) or type(error).__name__
+
+
+class Run:
+    def __init__(self, label):
+        self.label = label
+        self.started_at = time.time()
+        self.started = time.monotonic()
+        self.elapsed = None
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def as_dict(self):
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.started)
+        return {
+            "ts": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.started_at)),
+            "label": self.label,
+            "total_seconds": round(self.elapsed if self.elapsed is not None else time.monotonic() - self.started, 4),
+            "spans": [
+                {
+                    "name": s.name,
+                    "parent": s.parent.name if s.parent else None,
+                    "depth": s.depth,
+                    "offset_seconds": round(s.started - self.started, 4),
+                    "seconds": round(s.elapsed, 4),
+                    "error": s.error,
+                    **({"attrs": s.attrs} if s.attrs else {}),
+                }
+                for s in spans
+            ],
+        }
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(int(q * len(sorted_values)), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def _metric_name(name):
+    return re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+def _flatten(prefix, value, out):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            _flatten(f"{prefix}.{key}" if prefix else str(key), item, out)
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        out[prefix] = value
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = {}  # スパン名 -> 直近の所要時間
+        self._totals = {}  # スパン名 -> {"calls", "errors", "seconds"}
+        self._counters = {}
+        self._sources = {}  # 名前 -> 統計 dict を返す関数（http_client / sheet_cache など）
+        self.recent_runs = deque(maxlen=RECENT_RUNS)
+        self.log_path = None  # 指定すると実行ごとに JSONL で追記する
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self._totals.clear()
+            self._counters.clear()
+        self.recent_runs.clear()
+
+    # --- スパン ---
+    @contextmanager
+    def span(self, name, **attrs):
+        span = Span(name, _current_span.get(), attrs)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            # st.rerun / st.stop の例外は失敗として数えない
+            if isinstance(e, Exception):
+                span.fail(e)
+            raise
+        finally:
+            span.elapsed = time.monotonic() - span.started
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                # ジェネレーターを別のコンテキストで読み進めた場合
+                pass
+            self._record(span)
+
+    def _record(self, span):
+        with self._lock:
+            samples = self._samples.setdefault(span.name, deque(maxlen=SAMPLE_SIZE))
+            samples.append(span.elapsed)
+            total = self._totals.setdefault(span.name, {"calls": 0, "errors": 0, "seconds": 0.0})
+            total["calls"] += 1
+            total["errors"] += 1 if span.error else 0
+            total["seconds"] += span.elapsed
+        run = _current_run.get()
+        if run is not None:
+            run.add(span)
+
+    def traced(self, name):
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def mark_error(self, error):
+        # 例外を握りつぶして既定値を返す処理でも、失敗として数えられるようにする
+        span = _current_span.get()
+        if span is not None:
+            span.fail(error)
+
+    # --- カウンター ---
+    def inc(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def record_tokens(self, model, prompt_tokens=0, completion_tokens=0):
+        self.inc(f"gpt.requests.{model}")
+        self.inc(f"gpt.prompt_tokens.{model}", prompt_tokens)
+        self.inc(f"gpt.completion_tokens.{model}", completion_tokens)
+        span = _current_span.get()
+        if span is not None:
+            span.attrs["tokens"] = span.attrs.get("tokens", 0) + prompt_tokens + completion_tokens
+
+    def register_source(self, name, fn):
+        with self._lock:
+            self._sources[name] = fn
+
+    # --- 1回の実行 ---
+    def start_run(self, label):
+        run = Run(label)
+        _current_run.set(run)
+        return run
+
+    def finish_run(self, run):
+        run.elapsed = time.monotonic() - run.started
+        _current_run.set(None)
+        self.recent_runs.append(run)
+        self._record(_finished_span("run", run.elapsed))
+        if self.log_path:
+            try:
+                directory = os.path.dirname(self.log_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(run.as_dict(), ensure_ascii=False) + "\n")
+            except OSError as e:
+                print(f"計測ログの書き込み失敗: {e}")
+        return run
+
+    # --- 集計・出力 ---
+    def summary(self):
+        with self._lock:
+            items = [(name, list(samples), dict(self._totals[name])) for name, samples in self._samples.items()]
+        result = {}
+        for name, samples, total in sorted(items):
+            samples.sort()
+            result[name] = {
+                "calls": total["calls"],
+                "errors": total["errors"],
+                "avg_seconds": total["seconds"] / total["calls"],
+                "p50_seconds": _percentile(samples, 0.5),
+                "p95_seconds": _percentile(samples, 0.95),
+                "max_seconds": samples[-1],
+            }
+        return result
+
+    def counters(self):
+        with self._lock:
+            return dict(self._counters)
+
+    def sources(self):
+        with self._lock:
+            sources = dict(self._sources)
+        values = {}
+        for name, fn in sources.items():
+            try:
+                _flatten(name, fn(), values)
+            except Exception as e:
+                print(f"統計の取得失敗: {name}: {e}")
+        return values
+
+    def export_jsonl(self):
+        return "".join(json.dumps(run.as_dict(), ensure_ascii=False) + "\n" for run in list(self.recent_runs))
+
+    def prometheus_text(self):
+        lines = [
+            "# HELP launchtalk_span_seconds 外部呼び出し・処理ごとの所要時間",
+            "# TYPE launchtalk_span_seconds summary",
+        ]
+        summary = self.summary()
+        for name, stat in summary.items():
+            label = f'span="{name}"'
+            lines.append(f'launchtalk_span_seconds{{{label},quantile="0.5"}} {stat["p50_seconds"]:.6f}')
+            lines.append(f'launchtalk_span_seconds{{{label},quantile="0.95"}} {stat["p95_seconds"]:.6f}')
+            lines.append(f"launchtalk_span_seconds_sum{{{label}}} {stat['avg_seconds'] * stat['calls']:.6f}")
+            lines.append(f"launchtalk_span_seconds_count{{{label}}} {stat['calls']}")
+        lines.append("# TYPE launchtalk_span_errors_total counter")
+        for name, stat in summary.items():
+            lines.append(f'launchtalk_span_errors_total{{span="{name}"}} {stat["errors"]}')
+        for name, value in sorted(self.counters().items()):
+            metric = f"launchtalk_{_metric_name(name)}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+        for name, value in sorted(self.sources().items()):
+            metric = f"launchtalk_{_metric_name(name)}"
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _finished_span(name, elapsed):
+    span = Span(name, None, {})
+    span.elapsed = elapsed
+    return span
+
+
+metrics = Metrics()
+span = metrics.span
+traced = metrics.traced
+mark_error = metrics.mark_error
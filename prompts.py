@@ -0,0 +1,225 @@
+import json
+import re
+
+# === GPTへのプロンプトの組み立て ===
+# - タスクごとにモデルと出力の上限（max_tokens）を決める（翻訳・要約は安いモデル）
+# - 記事本文などの入力はトークン数の予算に収まるように文の区切りで切り詰める
+# - 雑談ネタ・見出しの翻訳は JSON スキーマで出力させ、見出しは1回のリクエストでまとめて訳す
+# secrets.toml の [gpt_tasks.<タスク名>] で model / max_tokens / input_tokens を上書きできる
+
+TASKS = {
+    "topics": {"model": "gpt-4o", "max_tokens": 900, "input_tokens": 700},
+    "translate": {"model": "gpt-4o-mini", "max_tokens": 1200, "input_tokens": 1500},
+    "summarize": {"model": "gpt-4o-mini", "max_tokens": 500, "input_tokens": 1500},
+}
+
+SENTENCE_END = re.compile(r"[。．！？!?\n]|\.\s")
+
+TOPIC_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "topics": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "title": {"type": "string"},
+                    "category": {"type": "string"},
+                    "content": {"type": "string"},
+                },
+                "required": ["title", "category", "content"],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["topics"],
+    "additionalProperties": False,
+}
+
+HEADLINE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "items": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "id": {"type": "integer"},
+                    "title": {"type": "string"},
+                    "description": {"type": "string"},
+                },
+                "required": ["id", "title", "description"],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["items"],
+    "additionalProperties": False,
+}
+
+TOPIC_SYSTEM = (
+    "あなたは職場の雑談ネタを考えるアシスタントです。"
+    "ネタごとに短いタイトル・一言のカテゴリ・2〜3文の内容を日本語で書いてください。"
+)
+
+
+def task_settings(task, overrides=None):
+    settings = dict(TASKS[task])
+    settings.update({key: value for key, value in dict(overrides or {}).items() if key in settings})
+    return settings
+
+
+# === トークン数 ===
+_encoding = []
+
+
+def count_tokens(text):
+    # tiktoken があれば正確に数え、無ければ概算（英数字は4文字で1トークン、日本語は1文字1トークン）
+    if not _encoding:
+        try:
+            import tiktoken
+
+            _encoding.append(tiktoken.get_encoding("o200k_base"))
+        except Exception:
+            _encoding.append(None)
+    if _encoding[0] is not None:
+        return len(_encoding[0].encode(text))
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return (ascii_chars + 3) // 4 + len(text) - ascii_chars
+
+
+def trim_to_tokens(text, budget):
+    # 予算に収まる長さまで縮め、なるべく文の終わりで切る
+    text = (text or "").strip()
+    if budget <= 0:
+        return ""
+    if count_tokens(text) <= budget:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(text[:middle]) <= budget:
+            low = middle
+        else:
+            high = middle - 1
+    cut = text[:low]
+    ends = [m.end() for m in SENTENCE_END.finditer(cut)]
+    if ends and ends[-1] >= len(cut) * 0.6:
+        cut = cut[:ends[-1]]
+    return cut.rstrip() + "…"
+
+
+# === プロンプト ===
+class Prompt:
+    def __init__(self, task, messages, model, max_tokens, response_format=None):
+        self.task = task
+        self.messages = messages
+        self.model = model
+        self.max_tokens = max_tokens
+        self.response_format = response_format
+
+    def params(self):
+        # chat.completions.create に渡す引数（model / messages 以外）
+        params = {"max_tokens": self.max_tokens}
+        if self.response_format:
+            params["response_format"] = self.response_format
+        return params
+
+    def text(self):
+        return "\n\n".join(message["content"] for message in self.messages)
+
+
+def _json_format(name, schema):
+    return {"type": "json_schema", "json_schema": {"name": name, "strict": True, "schema": schema}}
+
+
+def topic_prompt(instruction, context=None, count=3, settings=None):
+    # instruction: 何をテーマにするか / context: 天気・ニュース本文など（予算内に切り詰める）
+    settings = settings or task_settings("topics")
+    user = f"{instruction}\n日常会話で使える雑談ネタを{count}つ提案してください。"
+    if context:
+        user += "\n\n" + trim_to_tokens(context, settings["input_tokens"])
+    return Prompt(
+        "topics",
+        [{"role": "system", "content": TOPIC_SYSTEM}, {"role": "user", "content": user}],
+        settings["model"],
+        settings["max_tokens"],
+        _json_format("topics", TOPIC_SCHEMA),
+    )
+
+
+def translate_prompt(title, description, settings=None):
+    settings = settings or task_settings("translate")
+    text = trim_to_tokens(f"Title: {title}\nDescription: {description}", settings["input_tokens"])
+    return Prompt(
+        "translate",
+        [{"role": "user", "content": f"以下の英語ニュースのタイトルと概要を自然な日本語に翻訳してください：\n\n{text}"}],
+        settings["model"],
+        settings["max_tokens"],
+    )
+
+
+def translate_headlines_prompt(articles, settings=None):
+    # 見出し（タイトル＋概要）をまとめて1回で訳す。id は articles の添字
+    settings = settings or task_settings("translate")
+    per_item = max(settings["input_tokens"] // max(len(articles), 1), 40)
+    items = [
+        {
+            "id": i,
+            "title": trim_to_tokens(article.get("title") or "", per_item // 3),
+            "description": trim_to_tokens(article.get("description") or "", per_item - per_item // 3),
+        }
+        for i, article in enumerate(articles)
+    ]
+    user = (
+        "次の英語ニュースの見出しと概要を、それぞれ自然な日本語に翻訳してください。"
+        "id はそのまま返してください。\n\n" + json.dumps({"items": items}, ensure_ascii=False)
+    )
+    return Prompt(
+        "translate",
+        [{"role": "user", "content": user}],
+        settings["model"],
+        settings["max_tokens"],
+        _json_format("headlines", HEADLINE_SCHEMA),
+    )
+
+
+def summarize_prompt(description, settings=None):
+    settings = settings or task_settings("summarize")
+    text = trim_to_tokens(description, settings["input_tokens"])
+    return Prompt(
+        "summarize",
+        [{"role": "user", "content": (
+            f"以下のニュースの概要を日本語で、500文字以内に自然に要約してください：\n\n{text}\n\n"
+            "※難しい表現は避け、日常会話で使えるようにしてください。"
+        )}],
+        settings["model"],
+        settings["max_tokens"],
+    )
+
+
+# === 結果の解析 ===
+def parse_json(text):
+    # ```json のコードブロックで返ってきた場合も読む。JSON でなければ None
+    text = (text or "").strip()
+    if text.startswith("```"):
+        text = re.sub(r"^```[a-zA-Z]*\s*|\s*```$", "", text)
+    try:
+        return json.loads(text)
+    except ValueError:
+        return None
+
+
+def parse_headlines(text, count):
+    # 訳した見出しを元の順番で返す。読めなければ None
+    data = parse_json(text)
+    if not isinstance(data, dict) or not isinstance(data.get("items"), list):
+        return None
+    result = [None] * count
+    for item in data["items"]:
+        if not isinstance(item, dict):
+            continue
+        i = item.get("id")
+        if isinstance(i, int) and 0 <= i < count and item.get("title"):
+            result[i] = {"title": str(item["title"]).strip(), "description": str(item.get("description") or "").strip()}
+    return result if any(result) else None
@@ -0,0 +1,243 @@
+import bisect
+import heapq
+import threading
+from collections import Counter, defaultdict
+from datetime import date
+
+from talk_index import TALKED_VALUES, topic_date
+
+# === 保存済みのネタからのおすすめ（話す人ごと） ===
+# topics に溜まったネタのうち、その人にまだ紐づいていないものを
+#   - カテゴリの好み（その人・同じグループの人が話したネタのカテゴリ）
+#   - 新しさ（作成日から半減期 RECENCY_HALF_LIFE 日で下がる）
+#   - 同じグループの人がすでに話したか
+# で点数付けし、上位 RANKED_SIZE 件を人ごとに持っておく。
+# talk_logs / topics が増えたら TalkIndex から増えた分（topic_order / person_order / logs の後ろ）と
+# talked の書き換え（talked_changes）だけを取り込み、影響のある人
+# （その人と同じグループの人）の順位だけを作り直し済みでないものとして印を付ける。
+# 順位は印の付いた人を次に引いたときに作り直すので、引くのはたいてい上位 k 件を返すだけ。
+
+RANKED_SIZE = 50
+CANDIDATES_PER_CATEGORY = 100  # カテゴリごとに新しい順で見る件数
+PEER_CANDIDATES = 200
+RECENCY_HALF_LIFE = 30  # 日
+WEIGHTS = {"category": 0.5, "peers": 0.3, "recency": 0.2}
+UNTALKED_WEIGHT = 0.5  # 紐づいているがまだ話していないネタのカテゴリの重み
+GROUP_WEIGHT = 0.5  # 同じグループの人のカテゴリの好みをどれだけ混ぜるか
+
+
+def _key(value):
+    return str(value)
+
+
+def _age_days(day, today):
+    try:
+        return max((today - date.fromisoformat(day)).days, 0)
+    except ValueError:
+        return None
+
+
+class TopicRecommender:
+    def __init__(self, index):
+        self.index = index
+        self._lock = threading.RLock()
+        self._topics = None  # 取り込んだ TalkIndex の topics / persons / logs（作り直されたら別物になる）
+        self._persons = None
+        self._logs = None
+        self.ranked = {}  # person_id -> 上位の topic_id（点数の高い順）
+        self.dirty = set()  # 順位を作り直す必要のある person_id
+        self.rebuilds = 0
+        self.recomputed = 0
+
+    # --- 取り込み ---
+    def _reset_topics(self):
+        self._topics = self.index.topics
+        self._topic_count = 0
+        self.by_category = defaultdict(list)  # カテゴリ -> [(作成日, topic_id)] 古い順
+
+    def _reset_persons(self):
+        self._persons = self.index.persons
+        self._person_count = 0
+        self.group_of = {}
+        self.members = defaultdict(set)
+
+    def _reset_logs(self):
+        self._logs = self.index.logs
+        self._log_count = 0
+        self._change_count = 0
+        self.linked = defaultdict(set)  # person_id -> 紐づいている topic_id
+        self.person_categories = defaultdict(Counter)
+        self.group_categories = defaultdict(Counter)
+        self.group_talked = defaultdict(Counter)  # group_id -> topic_id -> 話した人数
+
+    def _sync(self):
+        index = self.index
+        dirty_all = False
+        if self._topics is not index.topics:
+            self._reset_topics()
+            dirty_all = True
+        if self._persons is not index.persons:
+            self._reset_persons()
+            dirty_all = True
+        if self._logs is not index.logs:
+            self._reset_logs()
+            dirty_all = True
+        if dirty_all:
+            # どれかが作り直されたら、人との紐づきも最初から数え直す
+            self._reset_logs()
+            self.ranked = {}
+            self.dirty = set()
+            self.rebuilds += 1
+
+        new_topics = index.topic_order[self._topic_count:]
+        for tid in new_topics:
+            record = index.topics[tid]
+            entries = self.by_category[str(record.get("category", ""))]
+            if self._topic_count:
+                bisect.insort(entries, (topic_date(record), tid))
+            else:
+                entries.append((topic_date(record), tid))
+        if new_topics:
+            if not self._topic_count:
+                for entries in self.by_category.values():
+                    entries.sort()
+            self._topic_count = len(index.topic_order)
+            # 新しいネタは誰の上位にも入りうる
+            self.dirty.update(self.ranked)
+
+        for pid in index.person_order[self._person_count:]:
+            group = _key(index.persons[pid].get("group_id"))
+            self.group_of[pid] = group
+            self.members[group].add(pid)
+        self._person_count = len(index.person_order)
+
+        # 取り込み済みの行の talked の書き換えを先に反映する（まだ取り込んでいない行は今の値で読む）
+        for position, old, new in index.talked_changes[self._change_count:]:
+            if position < self._log_count:
+                self._change_talked(index.logs[position], old, new)
+        self._change_count = len(index.talked_changes)
+
+        for record in index.logs[self._log_count:]:
+            self._add_log(record)
+        self._log_count = len(index.logs)
+
+    def _add_log(self, record):
+        tid, pid = _key(record.get("topic_id")), _key(record.get("person_id"))
+        topic = self.index.topics.get(tid)
+        if topic is None:
+            return
+        talked = record.get("talked") in TALKED_VALUES
+        category = str(topic.get("category", ""))
+        weight = 1.0 if talked else UNTALKED_WEIGHT
+        group = self.group_of.get(pid)
+        self.linked[pid].add(tid)
+        self.person_categories[pid][category] += weight
+        self._touch([pid])
+        if group is not None:
+            self.group_categories[group][category] += weight
+            if talked:
+                self.group_talked[group][tid] += 1
+            self._touch(self.members[group])
+
+    def _change_talked(self, record, old, new):
+        was, now = old in TALKED_VALUES, new in TALKED_VALUES
+        tid, pid = _key(record.get("topic_id")), _key(record.get("person_id"))
+        topic = self.index.topics.get(tid)
+        if was == now or topic is None:
+            return
+        category = str(topic.get("category", ""))
+        sign = 1 if now else -1
+        delta = sign * (1.0 - UNTALKED_WEIGHT)
+        group = self.group_of.get(pid)
+        self.person_categories[pid][category] += delta
+        self._touch([pid])
+        if group is not None:
+            self.group_categories[group][category] += delta
+            self.group_talked[group][tid] += sign
+            self._touch(self.members[group])
+
+    def _touch(self, pids):
+        # 順位を持っている人だけ作り直しの印を付ける（まだ引かれていない人は引いたときに作る）
+        self.dirty.update(pid for pid in pids if pid in self.ranked)
+
+    # --- 順位付け ---
+    def _affinity(self, pid, group):
+        own = self.person_categories.get(pid, Counter())
+        shared = self.group_categories.get(group, Counter())
+        own_total = sum(own.values()) or 1
+        shared_total = sum(shared.values()) or 1
+        categories = set(own) | set(shared)
+        return {
+            c: (own[c] / own_total + GROUP_WEIGHT * shared[c] / shared_total) / (1 + GROUP_WEIGHT)
+            for c in categories
+        }
+
+    def _rank(self, pid):
+        group = self.group_of.get(pid)
+        linked = self.linked.get(pid, set())
+        affinity = self._affinity(pid, group)
+        peers = self.group_talked.get(group, Counter())
+        peer_count = max(len(self.members.get(group, ())) - 1, 1)
+        today = date.today()
+
+        candidates = set()
+        for entries in self.by_category.values():
+            taken = 0
+            for _, tid in reversed(entries):
+                if taken >= CANDIDATES_PER_CATEGORY:
+                    break
+                if tid not in linked:
+                    candidates.add(tid)
+                    taken += 1
+        candidates.update(tid for tid, _ in peers.most_common(PEER_CANDIDATES) if tid not in linked)
+
+        def score(tid):
+            topic = self.index.topics.get(tid)
+            if topic is None:
+                return -1.0
+            age = _age_days(topic_date(topic), today)
+            recency = 0.5 ** (age / RECENCY_HALF_LIFE) if age is not None else 0.0
+            return (
+                WEIGHTS["category"] * affinity.get(str(topic.get("category", "")), 0.0)
+                + WEIGHTS["peers"] * min(peers.get(tid, 0) / peer_count, 1.0)
+                + WEIGHTS["recency"] * recency
+            )
+
+        self.ranked[pid] = heapq.nlargest(RANKED_SIZE, candidates, key=score)
+        self.dirty.discard(pid)
+        self.recomputed += 1
+
+    # --- 参照 ---
+    def refresh(self):
+        with self._lock:
+            self.index.refresh()
+            self._sync()
+        return self
+
+    def recommend(self, person_id, k=5):
+        # まだ紐づいていないネタを点数の高い順に k 件（topics のレコード）
+        pid = _key(person_id)
+        with self._lock:
+            self.refresh()
+            if pid not in self.index.persons:
+                return []
+            if pid in self.dirty or pid not in self.ranked:
+                self._rank(pid)
+            linked = self.linked.get(pid, set())
+            result = []
+            for tid in self.ranked[pid]:
+                if tid in linked or tid not in self.index.topics:
+                    continue
+                result.append(dict(self.index.topics[tid]))
+                if len(result) >= k:
+                    break
+            return result
+
+    def stats(self):
+        with self._lock:
+            return {
+                "persons_ranked": len(self.ranked),
+                "dirty": len(self.dirty),
+                "rebuilds": self.rebuilds,
+                "recomputed": self.recomputed,
+            }
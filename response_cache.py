@@ -0,0 +1,141 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from workers import submit
+
+# === 外部APIレスポンスのキャッシュ（stale-while-revalidate） ===
+# キーごとに「新鮮な期間(ttl)」と「古くても返してよい期間(stale_ttl)」を持つ。
+#   - ttl 以内      : そのまま返す
+#   - stale_ttl 以内: 古い値をすぐ返し、裏で取り直す
+#   - それ以降      : その場で取り直す
+# 保存先はメモリ（MemoryStore）かローカルディスク（DiskStore）を選べる。
+# どちらもモジュール単位で1つなので、Streamlit の再実行をまたいで残る。
+
+
+class MemoryStore:
+    # 件数上限付きのLRU
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._data[key] = entry
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class DiskStore:
+    # SQLite 1ファイルに pickle で保存する。件数上限を超えたら古く使われたものから消す
+    def __init__(self, path, max_entries=4096):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " key TEXT PRIMARY KEY, value BLOB NOT NULL, used_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_used_at ON cache (used_at)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def get(self, key):
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE cache SET used_at = ? WHERE key = ?", (time.time(), key))
+            return pickle.loads(row[0])
+
+    def set(self, key, entry):
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, used_at) VALUES (?, ?, ?)",
+                (key, pickle.dumps(entry), time.time()),
+            )
+            conn.execute(
+                "DELETE FROM cache WHERE key NOT IN ("
+                " SELECT key FROM cache ORDER BY used_at DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+
+    def delete(self, key):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def __len__(self):
+        with self._lock, self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+
+class ResponseCache:
+    def __init__(self, store, ttl, stale_ttl=None):
+        self.store = store
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl if stale_ttl is not None else ttl * 4
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def _fetch_and_store(self, key, fetch, is_valid):
+        value = fetch()
+        if is_valid(value):
+            self.store.set(key, (time.time(), value))
+        return value
+
+    def _refresh(self, key, fetch, is_valid):
+        try:
+            self._fetch_and_store(key, fetch, is_valid)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _refresh_in_background(self, key, fetch, is_valid):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        submit(self._refresh, key, fetch, is_valid)
+
+    def get_or_fetch(self, key, fetch, is_valid=bool):
+        # is_valid が False の結果（取得エラーなど）はキャッシュしない
+        entry = self.store.get(key)
+        if entry is not None:
+            fetched_at, value = entry
+            age = time.time() - fetched_at
+            if age < self.ttl:
+                return value
+            if age < self.stale_ttl:
+                self._refresh_in_background(key, fetch, is_valid)
+                return value
+        return self._fetch_and_store(key, fetch, is_valid)
+
+
+def make_store(backend="memory", path=".cache/responses.sqlite3", max_entries=512):
+    if backend == "disk":
+        return DiskStore(path, max_entries=max_entries)
+    return MemoryStore(max_entries=max_entries)
@@ -0,0 +1,414 @@
+import json
+import threading
+import time
+
+from metrics import span
+
+# === シートキャッシュ（TTL付き・書き込みはキャッシュ経由） ===
+# ワークシートを1回だけ全件取得してメモリに保持し、
+# get_all_records / get_all_values / col_values はそこから返す。
+# append_row / update は同じ内容をまずキャッシュに反映するので、
+# 直後の読み込みで再取得しなくても自分の書き込みが見える。
+#
+# シートへの書き込みはすぐには送らず、flush() でまとめて送る。
+#   - append_row は append_rows 1回にまとめる
+#   - update（全体書き換え）は前回のスナップショットとの差分行だけを batch_update 1回で送る
+#
+# TTL が切れたときの読み直しは差分で行う。
+#   - 手元の最終行から下だけを get("A{n}:..") で取得し、増えた行を足す
+#     （取得した先頭行が手元の最終行と違えば、行が消えた・並びが変わったとみなして全件取り直す）
+#   - full_sync_interval ごとに全件取り直し、他の人が途中の行を編集・削除したものを拾う
+#     （変わった行だけを差し替え、末尾に足されただけなら索引も作り直さない）
+
+DEFAULT_TTL = 60  # 秒
+DEFAULT_FULL_SYNC_INTERVAL = 10 * 60  # 秒
+
+
+def _to_value(value):
+    # シートに送る値（numpy の数値は Python の数値に戻す）
+    if value is None:
+        return ""
+    if hasattr(value, "item"):
+        value = value.item()
+    if isinstance(value, float) and value != value:  # NaN
+        return ""
+    return value
+
+
+def _payload_size(values):
+    return len(json.dumps(values, ensure_ascii=False, default=str).encode("utf-8"))
+
+
+# === 書き込み統計（API呼び出し・送信量をどれだけ節約したか） ===
+class WriteStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.api_calls = 0
+        self.api_calls_saved = 0
+        self.bytes_sent = 0
+        self.bytes_saved = 0
+
+    def record(self, calls, naive_calls, sent, naive_sent):
+        with self._lock:
+            self.api_calls += calls
+            self.api_calls_saved += max(naive_calls - calls, 0)
+            self.bytes_sent += sent
+            self.bytes_saved += max(naive_sent - sent, 0)
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "api_calls": self.api_calls,
+                "api_calls_saved": self.api_calls_saved,
+                "bytes_sent": self.bytes_sent,
+                "bytes_saved": self.bytes_saved,
+            }
+
+
+write_stats = WriteStats()
+
+
+# === 読み込み統計（差分取得でどれだけ再取得を省けたか） ===
+class SyncStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.full_loads = 0
+        self.incremental_syncs = 0
+        self.rows_fetched = 0
+        self.rows_reused = 0
+
+    def record(self, full, fetched, reused=0):
+        with self._lock:
+            if full:
+                self.full_loads += 1
+            else:
+                self.incremental_syncs += 1
+            self.rows_fetched += fetched
+            self.rows_reused += reused
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "full_loads": self.full_loads,
+                "incremental_syncs": self.incremental_syncs,
+                "rows_fetched": self.rows_fetched,
+                "rows_reused": self.rows_reused,
+            }
+
+
+sync_stats = SyncStats()
+
+
+def _to_cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, float) and value != value:  # NaN
+        return ""
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    return str(value)
+
+
+def _trim(cells):
+    cells = list(cells)
+    while cells and cells[-1] == "":
+        cells.pop()
+    return cells
+
+
+class CachedWorksheet:
+    def __init__(self, worksheet, ttl=DEFAULT_TTL, full_sync_interval=DEFAULT_FULL_SYNC_INTERVAL):
+        self.worksheet = worksheet
+        self.ttl = ttl
+        self.full_sync_interval = full_sync_interval
+        self._lock = threading.RLock()
+        self._header = None
+        self._rows = None
+        self._records = None
+        self._fetched_at = 0.0
+        self._full_synced_at = 0.0
+        # 行の並びが変わる（再取得・全体書き換え）たびに増える。索引の作り直しの目安
+        self.generation = 0
+        # 書き込み待ち: シートに反映済みの行数・差分のある行・元の呼び出し回数/送信量
+        self._synced = 0
+        self._dirty_rows = set()
+        self._header_dirty = False
+        self._pending_values = []
+        self._write_values = {}
+        self._naive_calls = 0
+        self._naive_bytes = 0
+
+    def __getattr__(self, name):
+        # title など、キャッシュしない属性は元のワークシートに任せる
+        return getattr(self.worksheet, name)
+
+    def _is_fresh(self):
+        return self._rows is not None and time.monotonic() - self._fetched_at < self.ttl
+
+    def _load(self):
+        if self._is_fresh():
+            return
+        self.flush()
+        if self._rows is not None and time.monotonic() - self._full_synced_at < self.full_sync_interval:
+            if self._sync_tail():
+                return
+        with span("sheets.load", sheet=self._title()):
+            values = self.worksheet.get_all_values()
+        self._replace(values)
+
+    def _sync_tail(self):
+        # 手元の最終行（データが無ければ見出し行）から下だけを取得する。取り込めなければ False
+        if not self._header or not hasattr(self.worksheet, "get"):
+            return False
+        from gspread.utils import rowcol_to_a1
+
+        width = len(self._header)
+        first = len(self._rows) + 1  # 手元の最終行のシート上の行番号
+        last_column = rowcol_to_a1(1, width)[:-1]
+        try:
+            with span("sheets.sync", sheet=self._title(), from_row=first):
+                values = self.worksheet.get(f"A{first}:{last_column}")
+        except Exception as e:
+            print(f"差分の取得失敗（全件取得に切り替え）: {self._title()}: {e}")
+            return False
+        values = [list(row) for row in values or []]
+        known = self._rows[-1] if self._rows else self._header
+        if not values or _trim(values[0][:width]) != _trim(known[:width]):
+            return False
+        new_rows = [self._normalize(row) for row in values[1:]]
+        self._extend(new_rows)
+        sync_stats.record(False, len(values), len(self._rows) - len(new_rows))
+        self._fetched_at = time.monotonic()
+        return True
+
+    def _extend(self, rows):
+        # 末尾に足された行だけを取り込む（行の並びは変わらないので generation はそのまま）
+        self._rows += rows
+        self._synced = len(self._rows)
+        if self._records is not None:
+            self._records += [self._record(row) for row in rows]
+
+    def _replace(self, values):
+        header = list(values[0]) if values else []
+        rows = [list(row) for row in values[1:]]
+        old = self._rows
+        self._fetched_at = self._full_synced_at = time.monotonic()
+        sync_stats.record(True, len(values))
+        if old is not None and _trim(header) == _trim(self._header) and len(rows) >= len(old):
+            changed = [i for i in range(len(old)) if _trim(old[i]) != _trim(rows[i])]
+            if not changed:
+                self._extend(rows[len(old):])
+                return
+            if len(rows) == len(old):
+                # 他の人が編集した行だけを差し替える
+                for i in changed:
+                    self._rows[i] = rows[i]
+                    if self._records is not None:
+                        self._records[i] = self._record(rows[i])
+                self.generation += 1
+                return
+        self._header = header
+        self._rows = rows
+        self._synced = len(self._rows)
+        self._records = None
+        self.generation += 1
+
+    def _title(self):
+        return getattr(self.worksheet, "title", "")
+
+    def _record(self, row):
+        from gspread.utils import numericise  # gspread は import が重いので使うときに読む
+
+        return {key: numericise(value) for key, value in zip(self._header, row)}
+
+    def _normalize(self, row):
+        cells = [_to_cell(v) for v in row]
+        if len(cells) < len(self._header):
+            cells += [""] * (len(self._header) - len(cells))
+        return cells
+
+    def has_pending_writes(self):
+        return bool(self._dirty_rows or self._header_dirty or self._pending_values)
+
+    # --- 読み込み ---
+    def get_all_values(self):
+        with self._lock:
+            self._load()
+            return [list(self._header)] + [list(row) for row in self._rows]
+
+    def get_all_records(self):
+        with self._lock:
+            self._load()
+            if self._records is None:
+                self._records = [self._record(row) for row in self._rows]
+            return [dict(record) for record in self._records]
+
+    def records_since(self, start):
+        # (世代, 全行数, start行目以降のレコード) をまとめて返す。索引の差分更新用
+        with self._lock:
+            self._load()
+            return self.generation, len(self._rows), [self._record(row) for row in self._rows[start:]]
+
+    def header(self):
+        with self._lock:
+            self._load()
+            return list(self._header)
+
+    def col_values(self, col):
+        with self._lock:
+            self._load()
+            index = col - 1
+            values = [self._header[index] if index < len(self._header) else ""]
+            values += [row[index] if index < len(row) else "" for row in self._rows]
+            while values and values[-1] == "":
+                values.pop()
+            return values
+
+    # --- 書き込み（キャッシュに反映し、シートへは flush でまとめて送る） ---
+    def append_row(self, values, **kwargs):
+        with self._lock:
+            if kwargs or self._rows is None:
+                return self._write_through_append(values, **kwargs)
+            row = self._normalize(values)
+            self._rows.append(row)
+            self._pending_values.append([_to_value(v) for v in values])
+            if self._records is not None:
+                self._records.append(self._record(row))
+            self._naive_calls += 1
+            self._naive_bytes += _payload_size([self._pending_values[-1]])
+
+    def append_rows(self, rows, **kwargs):
+        with self._lock:
+            for row in rows:
+                self.append_row(row, **kwargs)
+
+    def update(self, values, *args, **kwargs):
+        with self._lock:
+            if args or kwargs or not values or self._rows is None:
+                # 範囲指定の部分更新や未読み込みのシートはそのまま送り、次回取り直す
+                self.flush()
+                result = self.worksheet.update(values, *args, **kwargs)
+                write_stats.record(1, 1, _payload_size(values), _payload_size(values))
+                self._rows = None
+                self._records = None
+                self.generation += 1
+                return result
+
+            header = [_to_cell(v) for v in values[0]]
+            if header != self._header:
+                self._header = header
+                self._header_dirty = True
+            new_rows = [self._normalize(row) for row in values[1:]]
+            old_rows = self._rows
+
+            # 送信待ちの追加行は差し替えるだけ（まだシートに無い）
+            self._pending_values = [
+                [_to_value(v) for v in row] for row in values[1 + self._synced:]
+            ]
+            for i in range(min(self._synced, max(len(new_rows), len(old_rows)))):
+                old = old_rows[i] if i < len(old_rows) else None
+                new = new_rows[i] if i < len(new_rows) else None
+                if old != new:
+                    self._dirty_rows.add(i)
+
+            self._rows = new_rows
+            self._write_values = {i: values[1 + i] for i in self._dirty_rows if i < len(new_rows)}
+            self._records = None
+            self._fetched_at = time.monotonic()
+            self.generation += 1
+            self._naive_calls += 1
+            self._naive_bytes += _payload_size([[_to_value(v) for v in row] for row in values])
+
+    def update_row(self, index, values):
+        # 1行だけ書き換える（行の並びは変わらないので generation はそのまま）
+        with self._lock:
+            self._load()
+            row = self._normalize(values)
+            self._rows[index] = row
+            if index < self._synced:
+                self._dirty_rows.add(index)
+                self._write_values[index] = list(values)
+            else:
+                self._pending_values[index - self._synced] = [_to_value(v) for v in values]
+            if self._records is not None:
+                self._records[index] = self._record(row)
+            # 以前はこの変更のためにシート全体を書き直していた
+            self._naive_calls += 1
+            self._naive_bytes += _payload_size([[_to_value(v) for v in values]]) * (len(self._rows) + 1)
+
+    def _write_through_append(self, values, **kwargs):
+        self.flush()
+        result = self.worksheet.append_row(values, **kwargs)
+        write_stats.record(1, 1, _payload_size([values]), _payload_size([values]))
+        if self._rows is not None:
+            self._rows.append(self._normalize(values))
+            self._synced = len(self._rows)
+            self._records = None
+        return result
+
+    def _row_values(self, index, width):
+        if index >= len(self._rows):
+            return [""] * width  # 削除された末尾の行は空にする
+        source = self._write_values.get(index)
+        row = [_to_value(v) for v in source] if source is not None else list(self._rows[index])
+        return row + [""] * (width - len(row))
+
+    def flush(self):
+        # 溜まった書き込みをシートごとに batch_update 1回 + append_rows 1回で送る
+        with self._lock:
+            if not self.has_pending_writes():
+                return
+            calls = 0
+            sent = 0
+            width = max([len(self._header)] + [len(row) for row in self._rows or []])
+            from gspread.utils import rowcol_to_a1
+
+            if self._header_dirty or self._dirty_rows:
+                data = []
+                if self._header_dirty:
+                    data.append({
+                        "range": f"A1:{rowcol_to_a1(1, width)}",
+                        "values": [self._header + [""] * (width - len(self._header))],
+                    })
+                dirty = sorted(self._dirty_rows)
+                start = 0
+                while start < len(dirty):
+                    end = start
+                    while end + 1 < len(dirty) and dirty[end + 1] == dirty[end] + 1:
+                        end += 1
+                    first, last = dirty[start], dirty[end]
+                    data.append({
+                        "range": f"{rowcol_to_a1(first + 2, 1)}:{rowcol_to_a1(last + 2, width)}",
+                        "values": [self._row_values(i, width) for i in range(first, last + 1)],
+                    })
+                    start = end + 1
+                with span("sheets.batch_update", sheet=self._title(), ranges=len(data)):
+                    self.worksheet.batch_update(data)
+                calls += 1
+                sent += _payload_size(data)
+            if self._pending_values:
+                with span("sheets.append_rows", sheet=self._title(), rows=len(self._pending_values)):
+                    self.worksheet.append_rows(self._pending_values)
+                calls += 1
+                sent += _payload_size(self._pending_values)
+
+            write_stats.record(calls, self._naive_calls, sent, self._naive_bytes)
+            self._synced = len(self._rows or [])
+            self._dirty_rows = set()
+            self._header_dirty = False
+            self._pending_values = []
+            self._write_values = {}
+            self._naive_calls = 0
+            self._naive_bytes = 0
+
+
+def cache_worksheets(worksheets, ttl=DEFAULT_TTL, full_sync_interval=DEFAULT_FULL_SYNC_INTERVAL):
+    return {
+        name: CachedWorksheet(ws, ttl=ttl, full_sync_interval=full_sync_interval)
+        for name, ws in worksheets.items()
+    }
+
+
+def flush_worksheets(worksheets):
+    for ws in worksheets.values():
+        ws.flush()
@@ -0,0 +1,289 @@
+import json
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# === 保存先の切り替え（Google Sheets / SQLite / SQLite + Sheetsへのミラー） ===
+# アプリが使うワークシートの操作
+#   get_all_values / get_all_records / get / col_values
+#   append_row / append_rows / update / batch_update
+# だけを同じ名前で持つ「テーブル」を用意し、CachedWorksheet からはどれも同じように扱う。
+#
+#   sheets        : これまでどおり gspread のワークシート
+#   sqlite        : ローカルの SQLite ファイル（ネットワーク・クォータなし、テストやベンチ用にも）
+#   sqlite+sheets : 読み込みは SQLite、書き込みは SQLite に書いたあと裏で Sheets にも同じ操作を送る
+# どの保存先でも読み込みは CachedWorksheet がテーブル単位で行い、topic_id / person_id ごとの
+# 参照はメモリ上の TalkIndex が受け持つ（SQLite 側に列ごとの索引は持たない）。
+
+
+def _trim(cells):
+    cells = list(cells)
+    while cells and cells[-1] == "":
+        cells.pop()
+    return cells
+
+
+def _to_text(value):
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    return str(value)
+
+
+class SQLiteStorage:
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS sheet_rows ("
+                " tbl TEXT NOT NULL, row_no INTEGER NOT NULL, cells TEXT NOT NULL,"
+                " PRIMARY KEY (tbl, row_no))"
+            )
+
+    def table(self, name):
+        return SQLiteTable(self, name)
+
+
+class SQLiteTable:
+    # 1行目が見出し、2行目以降がデータ（行番号はシートと同じ1始まり）
+    def __init__(self, storage, title):
+        self.storage = storage
+        self.title = title
+
+    # --- 内部 ---
+    def _execute(self, sql, params=()):
+        return self.storage.conn.execute(sql, params)
+
+    def _put_row(self, row_no, cells):
+        cells = _trim(cells)
+        if not cells:
+            self._execute("DELETE FROM sheet_rows WHERE tbl = ? AND row_no = ?", (self.title, row_no))
+            return
+        self._execute(
+            "INSERT OR REPLACE INTO sheet_rows (tbl, row_no, cells) VALUES (?, ?, ?)",
+            (self.title, row_no, json.dumps(cells, ensure_ascii=False)),
+        )
+
+    def _write_range(self, start_row, start_col, values):
+        # start_row / start_col は0始まり（gspread のグリッド範囲と同じ）
+        for offset, row_values in enumerate(values):
+            row_no = start_row + offset + 1
+            existing = self._execute(
+                "SELECT cells FROM sheet_rows WHERE tbl = ? AND row_no = ?", (self.title, row_no)
+            ).fetchone()
+            cells = json.loads(existing[0]) if existing else []
+            needed = start_col + len(row_values)
+            if len(cells) < needed:
+                cells += [""] * (needed - len(cells))
+            for col, value in enumerate(row_values):
+                cells[start_col + col] = _to_text(value)
+            self._put_row(row_no, cells)
+
+    def _rows_after(self, row_no):
+        cursor = self._execute(
+            "SELECT row_no, cells FROM sheet_rows WHERE tbl = ? AND row_no > ? ORDER BY row_no",
+            (self.title, row_no),
+        )
+        return [(number, json.loads(cells)) for number, cells in cursor.fetchall()]
+
+    # --- 読み込み ---
+    def get_all_values(self, **kwargs):
+        with self.storage.lock:
+            rows = self._rows_after(0)
+        if not rows:
+            return []
+        width = max(len(cells) for _, cells in rows)
+        values = [[""] * width for _ in range(rows[-1][0])]
+        for row_no, cells in rows:
+            values[row_no - 1] = cells + [""] * (width - len(cells))
+        return values
+
+    def get_all_records(self, **kwargs):
+        from gspread.utils import numericise  # gspread は import が重いので使うときに読む
+
+        values = self.get_all_values()
+        if not values:
+            return []
+        header = values[0]
+        return [{key: numericise(value) for key, value in zip(header, row)} for row in values[1:]]
+
+    def get(self, range_name=None, **kwargs):
+        # A1 形式の範囲（"A5:F" のように行の終わりを省略してもよい）。末尾の空の行・セルは返さない
+        from gspread.utils import a1_range_to_grid_range
+
+        if range_name is None:
+            return [_trim(row) for row in self.get_all_values()]
+        grid = a1_range_to_grid_range(range_name)
+        top = grid.get("startRowIndex", 0)
+        left = grid.get("startColumnIndex", 0)
+        right = grid.get("endColumnIndex")
+        sql = "SELECT row_no, cells FROM sheet_rows WHERE tbl = ? AND row_no > ?"
+        params = [self.title, top]
+        if grid.get("endRowIndex") is not None:
+            sql += " AND row_no <= ?"
+            params.append(grid["endRowIndex"])
+        with self.storage.lock:
+            rows = self._execute(sql + " ORDER BY row_no", params).fetchall()
+        values = []
+        for row_no, cells in rows:
+            while len(values) < row_no - top - 1:
+                values.append([])
+            values.append(_trim(json.loads(cells)[left:right]))
+        while values and not values[-1]:
+            values.pop()
+        return values
+
+    def col_values(self, col, **kwargs):
+        values = [row[col - 1] if col - 1 < len(row) else "" for row in self.get_all_values()]
+        while values and values[-1] == "":
+            values.pop()
+        return values
+
+    # --- 書き込み ---
+    def append_rows(self, values, **kwargs):
+        with self.storage.lock, self.storage.conn:
+            last = self._execute(
+                "SELECT COALESCE(MAX(row_no), 0) FROM sheet_rows WHERE tbl = ?", (self.title,)
+            ).fetchone()[0]
+            for offset, row in enumerate(values):
+                self._put_row(last + offset + 1, [_to_text(v) for v in row])
+
+    def append_row(self, values, **kwargs):
+        self.append_rows([values], **kwargs)
+
+    def update(self, values, range_name=None, **kwargs):
+        from gspread.utils import a1_range_to_grid_range
+
+        with self.storage.lock, self.storage.conn:
+            if range_name is None:
+                # 範囲なしは A1 からの書き込み（既存の行はそのまま残るのはシートと同じ）
+                self._write_range(0, 0, values)
+                return
+            grid = a1_range_to_grid_range(range_name)
+            self._write_range(grid.get("startRowIndex", 0), grid.get("startColumnIndex", 0), values)
+
+    def batch_update(self, data, **kwargs):
+        from gspread.utils import a1_range_to_grid_range
+
+        with self.storage.lock, self.storage.conn:
+            for item in data:
+                grid = a1_range_to_grid_range(item["range"])
+                self._write_range(grid.get("startRowIndex", 0), grid.get("startColumnIndex", 0), item["values"])
+
+    def is_empty(self):
+        with self.storage.lock:
+            return self._execute(
+                "SELECT 1 FROM sheet_rows WHERE tbl = ? LIMIT 1", (self.title,)
+            ).fetchone() is None
+
+
+# === SQLite に書いたあと、同じ操作を裏で Sheets にも送る ===
+_mirror_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="launchtalk-mirror")
+
+
+# 送れなかった操作はやり直さない（ローカルが正）。件数と最後のエラーを残し、
+# 計測パネルとサイドバーの警告に出して、シートとずれていることが分かるようにする
+class MirrorStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.sent = 0
+        self.failed = 0
+        self.last_error = None
+
+    def queue(self):
+        with self._lock:
+            self.queued += 1
+
+    def record(self, error=None):
+        with self._lock:
+            self.queued -= 1
+            if error is None:
+                self.sent += 1
+            else:
+                self.failed += 1
+                self.last_error = error
+
+    def as_dict(self):
+        with self._lock:
+            return {"queued": self.queued, "sent": self.sent, "failed": self.failed}
+
+
+mirror_stats = MirrorStats()
+
+
+class MirroredTable:
+    def __init__(self, local, remote):
+        self.local = local
+        self.remote = remote
+        self.title = local.title
+
+    def __getattr__(self, name):
+        # 読み込み系はすべてローカルから
+        return getattr(self.local, name)
+
+    def _mirror(self, method, *args, **kwargs):
+        def send():
+            try:
+                getattr(self.remote, method)(*args, **kwargs)
+            except Exception as e:
+                mirror_stats.record(f"{self.title}.{method}: {e}")
+            else:
+                mirror_stats.record()
+        # 1スレッドで順番に送るので、シート上の操作順もローカルと同じになる
+        mirror_stats.queue()
+        _mirror_executor.submit(send)
+
+    def append_row(self, values, **kwargs):
+        self.local.append_row(values, **kwargs)
+        self._mirror("append_row", values, **kwargs)
+
+    def append_rows(self, values, **kwargs):
+        self.local.append_rows(values, **kwargs)
+        self._mirror("append_rows", values, **kwargs)
+
+    def update(self, values, *args, **kwargs):
+        self.local.update(values, *args, **kwargs)
+        self._mirror("update", values, *args, **kwargs)
+
+    def batch_update(self, data, **kwargs):
+        self.local.batch_update(data, **kwargs)
+        self._mirror("batch_update", data, **kwargs)
+
+
+def open_tables(backend, names, open_worksheet=None, path=".cache/launchtalk.sqlite3", headers=None):
+    # open_worksheet(name) は gspread のワークシートを返す関数（sheets / sqlite+sheets で使う）
+    # headers = {name: 見出しの列名}。中身が空のテーブルには最初にこの見出し行を書く
+    # （1行目は見出しとして読まれるので、空のまま足した最初の行が見出し扱いにならないように）
+    headers = headers or {}
+    if backend == "sheets":
+        return {name: open_worksheet(name) for name in names}
+
+    storage = SQLiteStorage(path)
+    tables = {name: storage.table(name) for name in names}
+    if backend == "sqlite":
+        for name, table in tables.items():
+            if name in headers and table.is_empty():
+                table.append_row(headers[name])
+        return tables
+    if backend == "sqlite+sheets":
+        mirrored = {}
+        for name, table in tables.items():
+            remote = open_worksheet(name)
+            if table.is_empty():
+                # 初回だけシートの中身をローカルに取り込む
+                table.update(remote.get_all_values())
+            mirrored[name] = MirroredTable(table, remote)
+            if name in headers and table.is_empty():
+                # シートも空なら、見出しはローカルとシートの両方に書く
+                mirrored[name].append_row(headers[name])
+        return mirrored
+    raise ValueError(f"unknown storage backend: {backend}")
@@ -0,0 +1,268 @@
+import threading
+from collections import defaultdict
+
+from dedupe import jaccard, shingles, topic_text
+
+# === talk_logs × topics × persons の索引 ===
+# topic_id / person_id / (topic_id, person_id) ごとに talk_logs の行番号を持っておき、
+# 一覧・詳細ページはテーブル全体を舐めずに必要な行だけを引く。
+# シートキャッシュの generation が変わらない限り、増えた行だけを差分で取り込む。
+
+TALKED_VALUES = ("TRUE", True)
+
+
+def _key(value):
+    return str(value)
+
+
+def topic_date(record):
+    # topics の2列目が作成日時（save_generated_topics が書く "YYYY-MM-DD HH:MM:SS"）
+    values = list(record.values())
+    return str(values[1])[:10] if len(values) > 1 else ""
+
+
+def _name_grams(text):
+    # 名前検索用の1文字・2文字の断片（大文字小文字は区別しない）
+    text = str(text).lower()
+    return set(text) | {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+class TalkIndex:
+    def __init__(self, topics_sheet, talk_logs_sheet, persons_sheet, dedupe_threshold=0.7):
+        self.dedupe_threshold = dedupe_threshold
+        self.sheets = {"topics": topics_sheet, "talk_logs": talk_logs_sheet, "persons": persons_sheet}
+        self._lock = threading.RLock()
+        self._state = {name: (None, 0) for name in self.sheets}  # (generation, 取り込み済み行数)
+        self._reset_topics()
+        self._reset_persons()
+        self._reset_logs()
+
+    # --- 作り直し・差分取り込み ---
+    def _reset_topics(self):
+        self.topics = {}
+        self.topic_order = []  # 取り込んだ順の topic_id（増えた分だけを後ろから読めるように）
+        self.topic_rows = {}
+        self.by_category = defaultdict(set)
+        # 重複チェック用の3-gram。保存時に比べる相手（その人のネタ）の分だけ作って覚えておく
+        self._shingles = {}
+
+    def _reset_persons(self):
+        self.persons = {}
+        self.person_order = []
+        self.person_rows = {}
+        self.name_grams = defaultdict(set)
+
+    def _reset_logs(self):
+        self.logs = []
+        self.by_topic = defaultdict(list)
+        self.by_person = defaultdict(list)
+        self.by_pair = defaultdict(list)
+        # set_talked で書き換えた talked の履歴 (行の位置, 前の値, 新しい値)。行は差し替えずに
+        # その場で書き換えるので、後から追う側（おすすめ）はこの履歴で変更を知る
+        self.talked_changes = []
+
+    def _add_topic(self, position, record):
+        tid = _key(record.get("topic_id"))
+        if tid not in self.topics:
+            self.topic_order.append(tid)
+        self.topics[tid] = record
+        self.topic_rows[tid] = position
+        self.by_category[str(record.get("category", ""))].add(tid)
+        self._shingles.pop(tid, None)
+
+    def _add_person(self, position, record):
+        pid = _key(record.get("person_id"))
+        if pid not in self.persons:
+            self.person_order.append(pid)
+        self.persons[pid] = record
+        self.person_rows[pid] = position
+        for gram in _name_grams(record.get("name", "")):
+            self.name_grams[gram].add(pid)
+
+    def _add_log(self, position, record):
+        tid, pid = _key(record.get("topic_id")), _key(record.get("person_id"))
+        self.logs.append(record)
+        self.by_topic[tid].append(position)
+        self.by_person[pid].append(position)
+        self.by_pair[(tid, pid)].append(position)
+
+    def refresh(self):
+        with self._lock:
+            handlers = {
+                "topics": (self._reset_topics, self._add_topic),
+                "persons": (self._reset_persons, self._add_person),
+                "talk_logs": (self._reset_logs, self._add_log),
+            }
+            for name, (reset, add) in handlers.items():
+                generation, indexed = self._state[name]
+                sheet = self.sheets[name]
+                start = indexed if generation == sheet.generation else 0
+                current, total, records = sheet.records_since(start)
+                if current != generation and start:
+                    # 読み込み中にシートが取り直されたので最初から
+                    start = 0
+                    current, total, records = sheet.records_since(0)
+                if start == 0:
+                    reset()
+                for offset, record in enumerate(records):
+                    add(start + offset, record)
+                self._state[name] = (current, total)
+        return self
+
+    # --- 参照（結果の件数に比例する） ---
+    def person(self, person_id):
+        return self.persons.get(_key(person_id))
+
+    def topic(self, topic_id):
+        return self.topics.get(_key(topic_id))
+
+    def persons_for_topic(self, topic_id):
+        return [self.logs[i]["person_id"] for i in self.by_topic.get(_key(topic_id), [])]
+
+    def categories(self):
+        return sorted(category for category, tids in self.by_category.items() if tids)
+
+    def is_talked(self, topic_id, person_id=None):
+        # person_id を省略した場合は誰かと話していれば True
+        tid = _key(topic_id)
+        if person_id is None:
+            positions = self.by_topic.get(tid, [])
+        else:
+            positions = self.by_pair.get((tid, _key(person_id)), [])
+        return any(self.logs[i].get("talked") in TALKED_VALUES for i in positions)
+
+    def filter_topics(self, category=None, person_id=None, talked=None, date_from=None, date_to=None):
+        # 絞り込み結果の topic_id をシートの並び順で返す
+        with self._lock:
+            candidates = None
+            if category is not None:
+                candidates = set(self.by_category.get(str(category), ()))
+            if person_id is not None:
+                linked = {_key(self.logs[i]["topic_id"]) for i in self.by_person.get(_key(person_id), [])}
+                candidates = linked if candidates is None else candidates & linked
+            if candidates is None:
+                tids = list(self.topics)
+            else:
+                tids = sorted((t for t in candidates if t in self.topics), key=self.topic_rows.get)
+
+            result = []
+            for tid in tids:
+                if talked is not None and self.is_talked(tid, person_id) != talked:
+                    continue
+                if date_from or date_to:
+                    day = topic_date(self.topics[tid])
+                    if (date_from and day < date_from) or (date_to and day > date_to):
+                        continue
+                result.append(tid)
+            return result
+
+    def search_persons(self, query):
+        # 名前の部分一致。断片の索引で候補を絞ってから確かめる
+        with self._lock:
+            query = str(query or "").strip().lower()
+            if not query:
+                return list(self.persons)
+            grams = [query[i:i + 2] for i in range(len(query) - 1)] or [query]
+            candidates = set.intersection(*(self.name_grams.get(g, set()) for g in grams))
+            matches = [
+                pid for pid in candidates
+                if query in str(self.persons[pid].get("name", "")).lower()
+            ]
+            return sorted(matches, key=self.person_rows.get)
+
+    def _topic_shingles(self, tid):
+        if tid not in self._shingles:
+            self._shingles[tid] = shingles(topic_text(self.topics[tid]))
+        return self._shingles[tid]
+
+    def find_similar_topics(self, topic, person_id):
+        # この人にすでに紐づいているネタのうち、topic とほぼ同じものの topic_id（類似度の高い順）
+        # 比べるのはその人のネタだけなので、topics 全体の件数には比例しない
+        with self._lock:
+            current = shingles(topic_text(topic))
+            linked = {_key(self.logs[i]["topic_id"]) for i in self.by_person.get(_key(person_id), [])}
+            scored = [
+                (tid, jaccard(current, self._topic_shingles(tid)))
+                for tid in linked if tid in self.topics
+            ]
+            return [
+                tid for tid, score in sorted(scored, key=lambda item: -item[1])
+                if score >= self.dedupe_threshold
+            ]
+
+    def drop_duplicates(self, topics, person_id):
+        # (保存するネタ, 重複として外したネタ) に分ける。同じ回に生成されたネタ同士も比べる
+        fresh, duplicates = [], []
+        for topic in topics:
+            current = shingles(topic_text(topic))
+            if self.find_similar_topics(topic, person_id) or any(
+                jaccard(current, shingles(topic_text(other))) >= self.dedupe_threshold for other in fresh
+            ):
+                duplicates.append(topic)
+            else:
+                fresh.append(topic)
+        return fresh, duplicates
+
+    def topics_for_person(self, person_id):
+        # 話す人のトピック（同じトピックの重複は1件にまとめる）。未話→話した の順
+        pid = _key(person_id)
+        seen = set()
+        result = []
+        for position in self.by_person.get(pid, []):
+            tid = _key(self.logs[position]["topic_id"])
+            if tid in seen or tid not in self.topics:
+                continue
+            seen.add(tid)
+            row = dict(self.topics[tid])
+            row.update(self.logs[position])
+            row["talked_flag"] = self.logs[position].get("talked") in TALKED_VALUES
+            result.append(row)
+        result.sort(key=lambda row: row["talked_flag"])
+        return result
+
+    # --- 更新（シートキャッシュにも反映） ---
+    def set_talked(self, topic_id, person_id, talked):
+        with self._lock:
+            self.refresh()
+            sheet = self.sheets["talk_logs"]
+            header = sheet.header()
+            value = "TRUE" if talked else "FALSE"
+            for position in self.by_pair.get((_key(topic_id), _key(person_id)), []):
+                record = self.logs[position]
+                if record.get("talked") != value:
+                    self.talked_changes.append((position, record.get("talked"), value))
+                record["talked"] = value
+                sheet.update_row(position, [record.get(column, "") for column in header])
+
+    def update_topic(self, topic_id, **fields):
+        with self._lock:
+            self.refresh()
+            tid = _key(topic_id)
+            if tid not in self.topics:
+                return False
+            sheet = self.sheets["topics"]
+            record = self.topics[tid]
+            self.by_category[str(record.get("category", ""))].discard(tid)
+            record.update(fields)
+            self.by_category[str(record.get("category", ""))].add(tid)
+            self._shingles.pop(tid, None)
+            sheet.update_row(self.topic_rows[tid], [record.get(column, "") for column in sheet.header()])
+            return True
+
+    def remove_talks(self, topic_ids, person_id):
+        # 行が詰まるので talk_logs は（何件消しても1回だけ）書き直し、索引は次の refresh で作り直す
+        with self._lock:
+            self.refresh()
+            removed = set()
+            for topic_id in topic_ids:
+                removed.update(self.by_pair.get((_key(topic_id), _key(person_id)), []))
+            if not removed:
+                return
+            sheet = self.sheets["talk_logs"]
+            header = sheet.header()
+            rows = [
+                [record.get(column, "") for column in header]
+                for position, record in enumerate(self.logs)
+                if position not in removed
+            ]
+            sheet.update([header] + rows)
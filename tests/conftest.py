@@ -0,0 +1,5 @@
+import os
+import sys
+
+# アプリのモジュールはリポジトリ直下に並んでいるので、そこから import できるようにする
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,34 @@
+from id_allocator import IdAllocator, max_numeric
+
+
+def test_ids_continue_across_allocators_sharing_a_file(tmp_path):
+    path = str(tmp_path / "ids.json")
+    first = IdAllocator(path, "topics", lease_size=3)
+    second = IdAllocator(path, "topics", lease_size=3)
+
+    ids = [first.allocate(), second.allocate(), first.allocate(), second.allocate()]
+    assert len(set(ids)) == len(ids)
+    assert sorted(ids) == [1, 2, 4, 5]
+
+
+def test_each_lease_starts_above_the_current_max_id(tmp_path):
+    existing = {"max": 10}
+    allocator = IdAllocator(str(tmp_path / "ids.json"), "topics", seed=lambda: existing["max"], lease_size=2)
+
+    assert [allocator.allocate(), allocator.allocate()] == [11, 12]
+    existing["max"] = 40  # 別のところから ID 40 までの行が足された
+    assert allocator.allocate() == 41
+
+
+def test_names_are_allocated_independently(tmp_path):
+    path = str(tmp_path / "ids.json")
+    topics = IdAllocator(path, "topics", lease_size=5)
+    persons = IdAllocator(path, "persons", lease_size=5)
+
+    assert topics.allocate() == 1
+    assert persons.allocate() == 1
+
+
+def test_max_numeric_ignores_non_numeric_ids():
+    assert max_numeric(["3", "12", "abc", "", 7]) == 12
+    assert max_numeric([]) == 0
@@ -0,0 +1,57 @@
+from benchmark import FakeWorksheet, Latency
+from recommend import TopicRecommender
+from sheet_cache import CachedWorksheet
+from talk_index import TalkIndex
+
+
+def make_index():
+    latency = Latency(scale=0)
+    topics = [["topic_id", "created_at", "title", "category", "content"]] + [
+        [str(i), "2024-01-0%d 00:00:00" % i, f"ネタ{i}", "天気" if i % 2 else "時事", "内容"]
+        for i in range(1, 6)
+    ]
+    persons = [["person_id", "name", "group_id"], ["10", "太郎", "1"], ["11", "花子", "1"]]
+    talk_logs = [["topic_id", "person_id", "talked"], ["1", "10", "FALSE"], ["2", "10", "FALSE"]]
+    sheets = {
+        name: CachedWorksheet(FakeWorksheet(name, values, latency))
+        for name, values in (("topics", topics), ("persons", persons), ("talk_logs", talk_logs))
+    }
+    return TalkIndex(sheets["topics"], sheets["talk_logs"], sheets["persons"]), sheets
+
+
+def counts(recommender):
+    return (
+        {pid: dict(c) for pid, c in recommender.person_categories.items()},
+        {group: dict(c) for group, c in recommender.group_categories.items()},
+        {group: +c for group, c in recommender.group_talked.items() if +c},
+    )
+
+
+def test_talked_changes_reach_the_recommender():
+    index, _ = make_index()
+    recommender = TopicRecommender(index)
+    recommender.recommend("11")
+
+    index.set_talked("1", "10", True)
+    recommender.refresh()
+    assert recommender.group_talked["1"]["1"] == 1
+    assert "11" in recommender.dirty
+    assert counts(recommender) == counts(TopicRecommender(index).refresh())
+
+    index.set_talked("1", "10", False)
+    recommender.refresh()
+    assert counts(recommender) == counts(TopicRecommender(index).refresh())
+
+
+def test_appended_rows_are_picked_up_without_a_rebuild():
+    index, sheets = make_index()
+    recommender = TopicRecommender(index)
+    recommender.recommend("11")
+
+    sheets["topics"].append_row(["6", "2024-01-09 00:00:00", "ネタ6", "天気", "内容"])
+    sheets["talk_logs"].append_row(["6", "10", "TRUE"])
+    result = [topic["topic_id"] for topic in recommender.recommend("11")]
+
+    assert recommender.rebuilds == 1
+    assert "6" in [str(tid) for tid in result]
+    assert counts(recommender) == counts(TopicRecommender(index).refresh())
@@ -0,0 +1,114 @@
+from benchmark import FakeWorksheet, Latency
+from sheet_cache import CachedWorksheet
+
+HEADER = ["topic_id", "person_id", "talked"]
+
+
+def make_sheet(rows, **kwargs):
+    fake = FakeWorksheet("talk_logs", [HEADER] + rows, Latency(scale=0))
+    return fake, CachedWorksheet(fake, **kwargs)
+
+
+def sheet_values(fake):
+    # Sheets の API と同じく、末尾の空の行は返さないものとして比べる
+    values = [list(row) for row in fake.values]
+    while values and not any(values[-1]):
+        values.pop()
+    return values
+
+
+def rows(count, talked="FALSE"):
+    return [[str(i), "10", talked] for i in range(1, count + 1)]
+
+
+def test_appends_and_row_updates_are_sent_in_one_batch():
+    fake, sheet = make_sheet(rows(3))
+    sheet.get_all_values()
+    fake.calls = 0
+
+    sheet.append_row(["4", "10", "FALSE"])
+    sheet.update_row(1, ["2", "10", "TRUE"])
+    assert fake.calls == 0
+
+    sheet.flush()
+    assert fake.calls == 2  # batch_update 1回 + append_rows 1回
+    assert sheet_values(fake) == sheet.get_all_values()
+    assert not sheet.has_pending_writes()
+
+
+def test_update_row_on_an_unsynced_row_rewrites_the_pending_append():
+    fake, sheet = make_sheet(rows(2))
+    sheet.get_all_values()
+    sheet.append_row(["3", "10", "FALSE"])
+    sheet.update_row(2, ["3", "10", "TRUE"])
+    fake.calls = 0
+
+    sheet.flush()
+    assert fake.calls == 1  # シートにまだ無い行なので append_rows だけ
+    assert sheet_values(fake)[-1] == ["3", "10", "TRUE"]
+
+
+def test_toggle_then_delete_with_appends_pending():
+    # 話した印を付けたあと、送信前に1行消す（talk_logs 全体の書き直し）
+    fake, sheet = make_sheet(rows(4))
+    sheet.get_all_values()
+    sheet.append_row(["5", "10", "FALSE"])
+    sheet.update_row(0, ["1", "10", "TRUE"])
+
+    values = sheet.get_all_values()
+    del values[2]  # topic_id 2 の行
+    sheet.update(values)
+    sheet.flush()
+
+    expected = [HEADER, ["1", "10", "TRUE"], ["3", "10", "FALSE"], ["4", "10", "FALSE"], ["5", "10", "FALSE"]]
+    assert sheet.get_all_values() == expected
+    assert sheet_values(fake) == expected
+
+
+def test_full_update_rediffs_rows_that_were_already_dirty():
+    fake, sheet = make_sheet(rows(3))
+    sheet.get_all_values()
+    sheet.update_row(1, ["2", "10", "TRUE"])
+    # 全体の書き直しで、さっき書き換えた行を元に戻す
+    sheet.update([HEADER] + rows(3))
+    sheet.flush()
+
+    assert sheet_values(fake) == [HEADER] + rows(3)
+
+
+def test_shrinking_rewrite_clears_the_rows_left_behind():
+    fake, sheet = make_sheet(rows(4))
+    sheet.get_all_values()
+    generation = sheet.generation
+
+    sheet.update([HEADER] + rows(2))
+    sheet.flush()
+
+    assert sheet.generation > generation
+    assert sheet_values(fake) == [HEADER] + rows(2)
+    assert sheet.get_all_values() == [HEADER] + rows(2)
+
+
+def test_incremental_sync_reads_only_the_appended_rows():
+    fake, sheet = make_sheet(rows(3), ttl=0)
+    sheet.get_all_values()
+    generation = sheet.generation
+    fake.append_rows([["4", "11", ""]])
+    fake.calls = 0
+
+    values = sheet.get_all_values()
+    assert values[-1] == ["4", "11", ""]
+    assert fake.calls == 1  # 手元の最終行から下だけを get で1回
+    assert sheet.generation == generation
+
+
+def test_incremental_sync_falls_back_to_a_full_load_on_mismatch():
+    # 手元の最終行とシートの同じ位置の行が違う（他の人が行を消した）なら全件取り直す
+    fake, sheet = make_sheet(rows(3), ttl=0)
+    sheet.get_all_values()
+    generation = sheet.generation
+    del fake.values[1]
+    fake.append_rows([["4", "11", ""]])
+
+    assert sheet.get_all_values() == sheet_values(fake)
+    assert sheet.generation > generation
@@ -0,0 +1,65 @@
+from sheet_cache import CachedWorksheet
+from storage import open_tables
+
+HEADERS = {
+    "topics": ["topic_id", "created_at", "title", "category", "content"],
+    "talk_logs": ["topic_id", "person_id", "talked"],
+}
+
+
+def open_sqlite(tmp_path):
+    return open_tables("sqlite", list(HEADERS), path=str(tmp_path / "db.sqlite3"), headers=HEADERS)
+
+
+def test_empty_sqlite_tables_get_headers(tmp_path):
+    tables = open_sqlite(tmp_path)
+    tables["talk_logs"].append_row(["1", "10"])
+
+    assert tables["talk_logs"].get_all_values() == [HEADERS["talk_logs"], ["1", "10", ""]]
+    assert tables["talk_logs"].get_all_records() == [{"topic_id": 1, "person_id": 10, "talked": ""}]
+
+
+def test_headers_are_written_only_once(tmp_path):
+    open_sqlite(tmp_path)["topics"].append_row(["1", "2024-01-01", "雨の日", "天気", "傘"])
+    tables = open_sqlite(tmp_path)
+
+    values = tables["topics"].get_all_values()
+    assert values[0] == HEADERS["topics"]
+    assert len(values) == 2
+
+
+def test_cached_worksheet_round_trip(tmp_path):
+    sheet = CachedWorksheet(open_sqlite(tmp_path)["talk_logs"])
+    sheet.append_row(["1", "10"])
+    sheet.append_row(["2", "10"])
+    sheet.update_row(0, ["1", "10", "TRUE"])
+    sheet.flush()
+
+    reopened = CachedWorksheet(open_sqlite(tmp_path)["talk_logs"])
+    assert reopened.get_all_records() == [
+        {"topic_id": 1, "person_id": 10, "talked": "TRUE"},
+        {"topic_id": 2, "person_id": 10, "talked": ""},
+    ]
+
+
+def test_mirror_failures_are_counted(tmp_path):
+    from storage import _mirror_executor, mirror_stats
+
+    class BrokenSheet:
+        def get_all_values(self):
+            return [HEADERS["talk_logs"]]
+
+        def append_row(self, values, **kwargs):
+            raise RuntimeError("quota exceeded")
+
+    before = mirror_stats.as_dict()["failed"]
+    tables = open_tables(
+        "sqlite+sheets", ["talk_logs"], lambda name: BrokenSheet(),
+        path=str(tmp_path / "db.sqlite3"), headers=HEADERS,
+    )
+    tables["talk_logs"].append_row(["1", "10"])
+    _mirror_executor.submit(lambda: None).result()
+
+    assert tables["talk_logs"].get_all_values()[1] == ["1", "10", ""]
+    assert mirror_stats.as_dict()["failed"] == before + 1
+    assert "quota exceeded" in mirror_stats.last_error
@@ -0,0 +1,58 @@
+import json
+
+from topic_parser import TopicStreamParser, parse_topics
+
+TOPICS = [
+    {"title": "雨の日", "category": "天気", "content": "傘の話"},
+    {"title": "新作映画", "category": "映画", "content": "週末の話"},
+]
+
+
+def feed_in_chunks(parser, text, size=7):
+    closed = []
+    for i in range(0, len(text), size):
+        closed.append(parser.feed(text[i:i + size]))
+    return closed
+
+
+def test_stream_text_topics_close_at_each_separator():
+    text = "".join(
+        f"---\nタイトル: {t['title']}\nカテゴリ: {t['category']}\n内容: {t['content']}\n---\n" for t in TOPICS
+    )
+    parser = TopicStreamParser()
+    closed = feed_in_chunks(parser, text)
+
+    assert [topic for chunk in closed for topic in chunk] == TOPICS
+    assert parser.close() == []
+
+
+def test_stream_text_keeps_the_last_block_without_a_separator():
+    parser = TopicStreamParser()
+    parser.feed("---\nタイトル: 雨の日\nカテゴリ: 天気\n")
+    assert parser.feed("内容: 傘の話") == []
+    assert parser.close() == [TOPICS[0]]
+
+
+def test_stream_json_topics_close_when_each_object_closes():
+    text = json.dumps({"topics": TOPICS}, ensure_ascii=False)
+    parser = TopicStreamParser()
+    closed = feed_in_chunks(parser, text, size=5)
+
+    assert [topic for chunk in closed for topic in chunk] == TOPICS
+    # 1つ目のネタは2つ目が届く前に返っている
+    first = next(i for i, chunk in enumerate(closed) if chunk)
+    assert closed[first] == [TOPICS[0]]
+    assert parser.close() == []
+
+
+def test_stream_json_ignores_braces_inside_strings():
+    topic = {"title": "括弧{の}話", "category": "雑談", "content": "\"}\" も文字"}
+    parser = TopicStreamParser()
+    closed = feed_in_chunks(parser, json.dumps({"topics": [topic]}, ensure_ascii=False), size=3)
+
+    assert [t for chunk in closed for t in chunk] == [topic]
+
+
+def test_parse_topics_skips_incomplete_blocks():
+    text = "---\nタイトル: 雨の日\nカテゴリ: 天気\n内容: 傘の話\n---\n---\nタイトル: 途中\n---"
+    assert parse_topics(text) == [TOPICS[0]]
@@ -0,0 +1,177 @@
+import json
+import re
+
+from prompts import parse_json
+
+# === GPT出力の解析 ===
+# JSON スキーマ（{"topics": [{"title", "category", "content"}, ...]}）で返ってきたものを読む。
+# JSON でなければ、これまでの ---区切り（タイトル: / カテゴリ: / 内容:）として読む。
+FIELDS = {"タイトル": "title", "カテゴリ": "category", "内容": "content"}
+PARTIAL_FIELD = re.compile(r'"(title|category|content)"\s*:\s*"((?:[^"\\]|\\.)*)')
+
+
+def topic_from_json(item):
+    if not isinstance(item, dict):
+        return None
+    topic = {field: str(item.get(field) or "").strip() for field in FIELDS.values()}
+    return topic if all(topic.values()) else None
+
+
+def topics_from_json(data):
+    # JSON のネタ一覧。形が違えば None
+    items = data.get("topics") if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        return None
+    topics = []
+    for item in items:
+        topic = topic_from_json(item)
+        if topic is None:
+            print(f"保存失敗: 項目が足りません\n内容: {item}")
+            continue
+        topics.append(topic)
+    return topics
+
+
+def format_topics(topics):
+    # 画面表示用（これまでと同じ ---区切りの見た目）
+    return "".join(
+        f"---\nタイトル: {t['title']}\nカテゴリ: {t['category']}\n内容: {t['content']}\n---\n" for t in topics
+    )
+
+
+def parse_topic_block(entry):
+    # 1ブロックを {"title", "category", "content"} にする。項目が欠けていれば None
+    topic = {}
+    for line in entry.strip().split("\n"):
+        line = line.strip()
+        if ":" not in line:
+            continue
+        label, value = line.split(":", 1)
+        for prefix, field in FIELDS.items():
+            if label.startswith(prefix) and field not in topic:
+                topic[field] = value.strip()
+    if len(topic) < len(FIELDS):
+        return None
+    return topic
+
+
+def parse_topics(topics_text):
+    data = parse_json(topics_text)
+    if data is not None:
+        topics = topics_from_json(data)
+        if topics is not None:
+            return topics
+    entries = [e.strip() for e in topics_text.strip().split("---") if e.strip()]
+    topics = []
+    for entry in entries:
+        topic = parse_topic_block(entry)
+        if topic is None:
+            print(f"保存失敗: 項目が足りません\n内容: {entry}")
+            continue
+        topics.append(topic)
+    return topics
+
+
+class TopicStreamParser:
+    # ストリーミング中の断片を受け取り、ネタが1つ閉じた時点でそれを返す
+    # 出だしが { / [ なら JSON（オブジェクトが閉じたら）、それ以外は --- 区切り（--- が来たら）
+    def __init__(self):
+        self._line = ""
+        self._block = []
+        self._mode = None
+        self._text = ""
+        self._pos = 0
+        self._in_string = False
+        self._escape = False
+        self._starts = []  # 閉じていない { の位置
+        self._closed = 0  # 最後に閉じた } の次の位置
+        self._topics = []
+
+    def _scan_json(self):
+        topics = []
+        text = self._text
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                self._starts.append(i)
+            elif ch == "}" and self._starts:
+                start = self._starts.pop()
+                self._closed = i + 1
+                try:
+                    topic = topic_from_json(json.loads(text[start:i + 1]))
+                except ValueError:
+                    topic = None
+                if topic:
+                    topics.append(topic)
+        self._pos = len(text)
+        return topics
+
+    def preview(self):
+        # 画面に出す途中経過。JSON のときは閉じたネタと書きかけのネタを見やすく並べる
+        if self._mode != "json":
+            return self._text
+        text = format_topics(self._topics)
+        if self._starts:
+            partial = {}
+            for field, value in PARTIAL_FIELD.findall(self._text[max(self._starts[-1], self._closed):]):
+                try:
+                    partial[field] = json.loads(f'"{value}"')
+                except ValueError:
+                    partial[field] = value
+            labels = {field: label for label, field in FIELDS.items()}
+            lines = [f"{labels[field]}: {value}" for field, value in partial.items()]
+            if lines:
+                text += "---\n" + "\n".join(lines) + "\n"
+        return text
+
+    def _finish_block(self):
+        text = "\n".join(self._block)
+        self._block = []
+        if not text.strip():
+            return []
+        topic = parse_topic_block(text)
+        return [topic] if topic else []
+
+    def feed(self, chunk):
+        if self._mode is None:
+            head = (self._text + chunk).lstrip()
+            if head:
+                self._mode = "json" if head[0] in "{[`" else "text"
+        self._text += chunk
+        if self._mode == "json":
+            topics = self._scan_json()
+            self._topics += topics
+            return topics
+
+        topics = []
+        self._line += chunk
+        while "\n" in self._line:
+            line, self._line = self._line.split("\n", 1)
+            if line.strip().startswith("---"):
+                topics += self._finish_block()
+            else:
+                self._block.append(line)
+        # 区切りの --- が見えた時点で（改行を待たずに）ブロックを閉じる
+        if self._line.strip().startswith("---") and self._block:
+            topics += self._finish_block()
+        return topics
+
+    def close(self):
+        if self._mode == "json":
+            return []
+        # 最後の --- が無いまま終わったブロックも拾う
+        if self._line.strip().startswith("---"):
+            self._line = ""
+        if self._line:
+            self._block.append(self._line)
+            self._line = ""
+        return self._finish_block()
@@ -0,0 +1,125 @@
+import threading
+import time
+from collections import defaultdict, deque
+
+from workers import run_with_timeout
+
+# === 雑談ネタの事前生成プール ===
+# (モード, 都市) ごとに生成済みのネタを裏で作り置きしておき、
+# 生成フォームからはプールにあればすぐ返す（無ければこれまでどおりその場で生成）。
+#   - 元になった天気・ニュースが変わったネタは捨てる（fingerprint で比較）
+#   - 1時間あたりのトークン上限を超えそうなら作り置きを止める
+
+
+_UNKNOWN = object()
+
+
+class TopicPool:
+    def __init__(self, keys, generate, fingerprint, target_size=1, tokens_per_hour=20000,
+                 max_age=3 * 60 * 60, interval=30):
+        # generate(key) -> (生成テキスト, 使ったトークン数)
+        # fingerprint(key) -> 元データの目印（天気の内容・ニュースのURLなど）
+        self.keys = list(keys)
+        self.generate = generate
+        self.fingerprint = fingerprint
+        self.target_size = target_size
+        self.tokens_per_hour = tokens_per_hour
+        self.max_age = max_age
+        self.interval = interval
+        self._pool = defaultdict(deque)  # key -> (作成時刻, fingerprint, テキスト)
+        self._usage = deque()  # (時刻, トークン数)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.generated = 0
+
+    def start(self):
+        if self._thread is None and self.tokens_per_hour > 0:
+            self._thread = threading.Thread(target=self._run, name="launchtalk-topic-pool", daemon=True)
+            self._thread.start()
+        return self
+
+    # --- 取り出し（リクエスト側） ---
+    def take(self, key, timeout=None):
+        # 元データの確認（fingerprint）が timeout 秒で終わらない・失敗したときは作り置きを使わない
+        current = run_with_timeout(self.fingerprint, key, timeout=timeout, default=_UNKNOWN)
+        if current is _UNKNOWN:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            entries = self._pool[key]
+            self._drop_stale(entries, current)
+            if entries:
+                self.hits += 1
+                text = entries.popleft()[2]
+            else:
+                self.misses += 1
+                text = None
+        self._wake.set()  # 減った分をすぐ補充する
+        return text
+
+    def _drop_stale(self, entries, current):
+        now = time.time()
+        fresh = [e for e in entries if e[1] == current and now - e[0] < self.max_age]
+        self.expired += len(entries) - len(fresh)
+        entries.clear()
+        entries.extend(fresh)
+
+    # --- トークン予算 ---
+    def tokens_used(self):
+        cutoff = time.time() - 60 * 60
+        with self._lock:
+            while self._usage and self._usage[0][0] < cutoff:
+                self._usage.popleft()
+            return sum(tokens for _, tokens in self._usage)
+
+    def _within_budget(self):
+        return self.tokens_used() < self.tokens_per_hour
+
+    # --- 補充（バックグラウンド） ---
+    def refill_once(self):
+        for key in self.keys:
+            if not self._within_budget():
+                return
+            try:
+                current = self.fingerprint(key)
+            except Exception:
+                continue
+            with self._lock:
+                entries = self._pool[key]
+                self._drop_stale(entries, current)
+                if len(entries) >= self.target_size:
+                    continue
+            try:
+                text, tokens = self.generate(key)
+            except Exception as e:
+                print(f"事前生成失敗: {key}: {e}")
+                continue
+            with self._lock:
+                self._usage.append((time.time(), tokens))
+                if text:
+                    self._pool[key].append((time.time(), current, text))
+                    self.generated += 1
+
+    def _run(self):
+        while True:
+            self.refill_once()
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def stats(self):
+        with self._lock:
+            ready = sum(len(entries) for entries in self._pool.values())
+            stats = {
+                "ready": ready,
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "generated": self.generated,
+            }
+        stats["tokens_last_hour"] = self.tokens_used()
+        return stats
@@ -0,0 +1,83 @@
+import contextvars
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# === 外部API呼び出し用のスレッドプール ===
+# ニュース・記事本文・天気・GPT は待ち時間がほとんどなので、
+# 独立したものはスレッドで同時に投げ、終わった順に画面へ出す。
+# 時間制限付きで投げた処理には締め切り（stage_deadline）を持たせ、
+# http_client はその残り時間で接続・読み込みのタイムアウトとリトライを打ち切る。
+
+MAX_WORKERS = 8
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="launchtalk-io")
+
+
+_deadline = contextvars.ContextVar("launchtalk_stage_deadline", default=None)
+
+
+class StageTimeout(Exception):
+    pass
+
+
+def stage_deadline():
+    # 実行中の処理の締め切り（time.monotonic() の値）。時間制限なしなら None
+    return _deadline.get()
+
+
+def _submit(fn, args, kwargs, deadline):
+    context = contextvars.copy_context()
+    context.run(_deadline.set, deadline)
+    return _executor.submit(context.run, fn, *args, **kwargs)
+
+
+def submit(fn, *args, **kwargs):
+    # 呼び出し元のコンテキスト（計測中のスパンなど）を引き継いで実行する
+    # 締め切りは引き継がない（裏での取り直しなどは呼び出し元の時間制限と関係なく最後まで行う）
+    return _submit(fn, args, kwargs, None)
+
+
+def _deadline_after(timeout):
+    return time.monotonic() + timeout if timeout else None
+
+
+def run_with_timeout(fn, *args, timeout=None, default=None, **kwargs):
+    # 1つの処理にだけ時間制限をかける（時間切れなら default を返す）
+    future = _submit(fn, args, kwargs, _deadline_after(timeout))
+    try:
+        return future.result(timeout=timeout)
+    except Exception:
+        return default
+
+
+def iter_completed(tasks):
+    # tasks: {名前: (関数, 引数タプル, タイムアウト秒)}
+    # 終わった順に (名前, 結果, 例外) を返す。時間切れは StageTimeout になる。
+    futures = {}
+    deadlines = {}
+    for name, (fn, args, timeout) in tasks.items():
+        deadlines[name] = _deadline_after(timeout)
+        futures[_submit(fn, args, {}, deadlines[name])] = name
+
+    pending = set(futures)
+    while pending:
+        now = time.monotonic()
+        remaining = [deadlines[futures[f]] - now for f in pending if deadlines[futures[f]] is not None]
+        wait_for = max(min(remaining), 0) if remaining else None
+        done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+
+        for future in done:
+            name = futures[future]
+            try:
+                yield name, future.result(), None
+            except Exception as e:
+                yield name, None, e
+
+        now = time.monotonic()
+        for future in list(pending):
+            deadline = deadlines[futures[future]]
+            if deadline is not None and now >= deadline:
+                # 実行中のスレッドは止められないので、結果を待たずに諦める
+                future.cancel()
+                pending.discard(future)
+                yield futures[future], None, StageTimeout(futures[future])